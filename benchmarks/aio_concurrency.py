@@ -0,0 +1,97 @@
+"""Benchmark of many concurrent requests to :class:`pytexcount.aio.AsyncWordCounter`.
+
+``requests`` requests (over ``documents`` distinct documents) are made at once, while a ticker measures how late the
+event loop wakes it up (which is the time during which the loop was blocked).
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pytexcount import aio
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit']
+
+
+def make_document(rng: random.Random, size: int) -> str:
+    parts = ['\\documentclass{article}\n\\begin{document}\n']
+    length = 0
+    while length < size:
+        part = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+        part = rng.choice([
+            '{}\n\n',
+            '\\section{{{}}}\n',
+            'a \\textbf{{{}}} b\n',
+            '\\begin{{itemize}}\n\\item {}\n\\end{{itemize}}\n',
+            '$x^{{2}}$ {} % comment\n',
+        ]).format(part)
+        parts.append(part)
+        length += len(part)
+
+    parts.append('\\end{document}\n')
+    return ''.join(parts)
+
+
+async def ticker(period: float, lags: list, done: asyncio.Event):
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append(time.perf_counter() - start - period)
+
+
+async def run(counter: aio.AsyncWordCounter, texts: list) -> dict:
+    lags = []
+    done = asyncio.Event()
+    tick = asyncio.ensure_future(ticker(.005, lags, done))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(counter.count_text(text) for text in texts))
+    elapsed = time.perf_counter() - start
+
+    done.set()
+    await tick
+
+    lags.sort()
+    return {'seconds': elapsed, 'max_lag': lags[-1], 'p99_lag': lags[int(.99 * (len(lags) - 1))]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--requests', type=int, default=256)
+    parser.add_argument('-d', '--documents', type=int, default=64)
+    parser.add_argument('-s', '--size', type=int, default=17000, help='size of each document')
+    parser.add_argument('-c', '--max-concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [make_document(rng, args.size) for _ in range(args.documents)]
+    texts = [documents[i % len(documents)] for i in range(args.requests)]
+    rng.shuffle(texts)
+
+    start = time.perf_counter()
+    for document in documents:
+        aio.count(document, [], [], [])
+    print('sequential: {:.2f} s'.format(time.perf_counter() - start))
+
+    executors = [
+        ('threads (default)', lambda: None),
+        ('threads', lambda: ThreadPoolExecutor(args.max_concurrency)),
+        ('processes', lambda: ProcessPoolExecutor(args.max_concurrency)),
+    ]
+
+    for name, make_executor in executors:
+        executor = make_executor()
+        counter = aio.AsyncWordCounter(executor=executor, max_concurrency=args.max_concurrency)
+        result = asyncio.run(run(counter, texts))
+        if executor is not None:
+            executor.shutdown()
+
+        print('{}: {:.2f} s, event loop lag: {:.0f} ms (max), {:.0f} ms (p99)'.format(
+            name, result['seconds'], 1000 * result['max_lag'], 1000 * result['p99_lag']))
+
+
+if __name__ == '__main__':
+    main()
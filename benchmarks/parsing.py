@@ -0,0 +1,80 @@
+"""Micro-benchmark of the parser, on a generated paper-like document.
+
+To compare two versions, run it with ``PYTHONPATH`` set to each of them (the best of ``--repeat`` runs is given).
+"""
+
+import argparse
+import random
+import time
+
+from pytexcount.parser import Parser
+from pytexcount.count import WordCounter
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod']
+
+
+def make_document(rng: random.Random, size: int) -> str:
+    def words(n: int) -> str:
+        return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+    def sentence() -> str:
+        return rng.choice([
+            '{} {}.',
+            '{} $x_{{i}}^2 + \\alpha$ {}.',
+            '{} \\textbf{{{}}}.',
+            '{} \\emph{{{}}}~\\cite{{ref}}.',
+            '{} (see Fig.~\\ref{{fig:a}}) {}.',
+            '{} % a comment\n{}.',
+        ]).format(words(rng.randint(3, 12)), words(rng.randint(1, 6)))
+
+    parts = ['\\documentclass[a4paper]{article}\n\\usepackage{amsmath}\n\\begin{document}\n']
+    length = 0
+    while length < size:
+        part = rng.choice([
+            '\\section{{{}}}\n\n',
+            '{}\n\n', '{}\n\n', '{}\n\n', '{}\n\n',
+            '\\begin{{equation}}\n\\int_0^1 f(x) \\, dx = \\frac{{1}}{{2}} % {}\n\\end{{equation}}\n',
+            '\\begin{{itemize}}\n\\item {}\n\\item {}\n\\end{{itemize}}\n\n',
+            '\\begin{{figure}}[h]\n\\includegraphics[width=\\linewidth]{{a.pdf}}\n\\caption{{{}}}\n\\end{{figure}}\n\n',
+        ])
+        part = part.format(*(' '.join(sentence() for _ in range(rng.randint(1, 5))) for _ in range(part.count('{}'))))
+        parts.append(part)
+        length += len(part)
+
+    parts.append('\\end{document}\n')
+    return ''.join(parts)
+
+
+def best(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-s', '--size', type=int, default=342000, help='size of the document')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    source = make_document(random.Random(args.seed), args.size)
+    counter = WordCounter(['equation'], ['textbf', 'emph', 'section', 'caption'], [])
+
+    benchmarks = [
+        ('parse', lambda: Parser(source).parse()),
+        ('parse with spans', lambda: Parser(source, spans=True).parse()),
+        ('lazy parse + count', lambda: counter(Parser(source, lazy=True).parse())),
+    ]
+
+    print('{} chars'.format(len(source)))
+    for name, func in benchmarks:
+        print('{}: {:.0f} ms'.format(name, 1000 * best(func, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""Count words from within an :mod:`asyncio` event loop, without blocking it.
+
+Parsing and counting are offloaded to an executor (the default thread pool of the loop unless told otherwise).
+Since parsing holds the GIL, counts cannot run in parallel in threads, and several of them would only compete with the
+event loop for the GIL (delaying it by hundreds of milliseconds on large documents): in a thread pool, counts thus run
+one at a time. Use a :class:`concurrent.futures.ProcessPoolExecutor` to actually count in parallel, with the lowest
+latency for the event loop.
+"""
+
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import List, Iterable, Optional
+
+from pytexcount.parser import Parser
+from pytexcount.count import WordCounter
+
+
+def count(text: str, exclude_env: List[str], include_macro: List[str], macro_as_words: List[str]) -> int:
+    """Parse ``text`` and count its words. Defined at module level so that it can be sent to a process.
+    """
+
+    return WordCounter(exclude_env, include_macro, macro_as_words)(Parser(text).parse())
+
+
+def read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+class CountCache:
+    """Thread-safe LRU cache of counts, keyed by digest.
+    It can be shared between counters, since the configuration is part of the key.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: bytes) -> Optional[int]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+
+            return value
+
+    def put(self, key: bytes, value: int):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class AsyncWordCounter:
+    """Count words asynchronously.
+
+    At most ``max_concurrency`` counts are submitted to the executor at the same time (only one, if it is a thread
+    pool, but files are still read concurrently), other requests wait for their turn (which gives backpressure to the
+    callers).
+    Concurrent requests for the same text share a single count.
+    A count is cancelled when all the requests waiting for it are, though a count that already started in a thread
+    runs to its end (its result is then dropped).
+    """
+
+    def __init__(
+            self,
+            exclude_env: List[str] = None,
+            include_macro: List[str] = None,
+            macro_as_words: List[str] = None,
+            executor: Executor = None,
+            max_concurrency: int = 4,
+            cache: CountCache = None):
+
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be at least 1, got {}'.format(max_concurrency))
+
+        self.exclude_env = list(exclude_env) if exclude_env is not None else []
+        self.include_macro = list(include_macro) if include_macro is not None else []
+        self.macro_as_words = list(macro_as_words) if macro_as_words is not None else []
+
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.threads = executor is None or isinstance(executor, ThreadPoolExecutor)
+        self.cache = cache if cache is not None else CountCache()
+
+        self.salt = repr(
+            (sorted(self.exclude_env), sorted(self.include_macro), sorted(self.macro_as_words))).encode()
+
+        # the semaphore and the tasks are bound to the loop in which they are used
+        self._loop = None
+        self._semaphore = None
+        self._counting = None
+        self._pending = {}
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._counting = asyncio.Semaphore(1 if self.threads else self.max_concurrency)
+            self._pending = {}
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha1(self.salt + text.encode('utf-8', 'surrogatepass')).digest()
+
+    async def _submit(self, func, *args):
+        self._bind()
+        async with self._semaphore:
+            return await self._loop.run_in_executor(self.executor, func, *args)
+
+    async def _count(self, key: bytes, text: str) -> int:
+        try:
+            async with self._counting:
+                value = await self._submit(count, text, self.exclude_env, self.include_macro, self.macro_as_words)
+
+            self.cache.put(key, value)
+            return value
+        finally:
+            # unless it was cancelled (and then already removed)
+            if key in self._pending and self._pending[key][0] is asyncio.current_task():
+                del self._pending[key]
+
+    async def count_text(self, text: str) -> int:
+        """Count the words of ``text``
+        """
+
+        key = self.key(text)
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+
+        self._bind()
+        if key not in self._pending:
+            self._pending[key] = [asyncio.ensure_future(self._count(key, text)), 0]
+
+        pending = self._pending[key]
+        task = pending[0]
+        pending[1] += 1
+
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            pending[1] -= 1
+            if pending[1] == 0:
+                # removed at once, so that a new request does not join the task while it is being cancelled
+                if self._pending.get(key) is pending:
+                    del self._pending[key]
+                task.cancel()
+            raise
+
+    async def count_file(self, path: str) -> int:
+        """Count the words of the file at ``path``
+        """
+
+        return await self.count_text(await self._submit(read, path))
+
+    async def count_files(self, paths: Iterable[str]) -> List[int]:
+        """Count the words of each file in ``paths``, and return the counts in the same order.
+        Only ``max_concurrency`` files are read at any time.
+        """
+
+        paths = list(paths)
+        counts = [0] * len(paths)
+        queue = iter(enumerate(paths))
+
+        async def worker():
+            for i, path in queue:
+                counts[i] = await self.count_file(path)
+
+        tasks = [asyncio.ensure_future(worker()) for _ in range(min(self.max_concurrency, len(paths)))]
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return counts
+
+
+_default_cache = CountCache()
+
+
+async def count_text(
+        text: str,
+        exclude_env: List[str] = None,
+        include_macro: List[str] = None,
+        macro_as_words: List[str] = None,
+        executor: Executor = None) -> int:
+    """Count the words of ``text``, using a cache shared by all the calls to this function.
+    To bound the number of concurrent counts, use (and share) an :class:`AsyncWordCounter` instead.
+    """
+
+    return await AsyncWordCounter(
+        exclude_env, include_macro, macro_as_words, executor=executor, cache=_default_cache).count_text(text)
+
+
+async def count_files(
+        paths: Iterable[str],
+        exclude_env: List[str] = None,
+        include_macro: List[str] = None,
+        macro_as_words: List[str] = None,
+        executor: Executor = None,
+        max_concurrency: int = 4) -> List[int]:
+    """Count the words of each file in ``paths``, using a cache shared by all the calls to this function.
+    """
+
+    return await AsyncWordCounter(
+        exclude_env,
+        include_macro,
+        macro_as_words,
+        executor=executor,
+        max_concurrency=max_concurrency,
+        cache=_default_cache
+    ).count_files(paths)
@@ -0,0 +1,288 @@
+"""Estimate the number of words of a large document, by counting only samples of it.
+
+The beginning (with the preamble) and the end of the file are counted exactly. The rest is divided in strata of equal
+size, and the paragraphs which start in a window at a random position of each stratum are read (in random order, until
+the byte or time budget is spent). Blank lines are safe points to start parsing, since they end paragraphs, and are thus
+normally not inside braces. The environments which are cut at the edges of the window are completed, and the paragraphs
+are counted as usual.
+The number of words per byte in the chunks is then extrapolated to the rest of the file (ratio estimator), with a
+confidence interval. The runtime thus depends on the budget, not on the size of the file.
+"""
+
+import io
+import math
+import random
+import re
+import time
+from typing import BinaryIO, List, Optional, Tuple
+
+from pytexcount.parser import Parser, ParserSyntaxError, Damaged
+from pytexcount.count import WordCounter
+
+
+BLANK_LINE = re.compile(rb'\n[ \t]*\n')
+NEWLINE = re.compile(rb'\n')
+ENVIRONMENT = re.compile(r'\\(begin|end)[ \t\n]*\{([^\\{}]*)\}')
+
+LOOKBEHIND = 256  # to find a blank line which ends just at the start of a window
+MAX_READ = 4  # length of a window, before giving up on finding the end of a paragraph
+
+
+class Estimate:
+    """Estimated number of words, which is within ``[low, high]`` with a probability of ``confidence``.
+    If the whole file was counted (``exact``), the three are the same.
+    ``damaged`` is the number of parts which could not be parsed (in recovery mode), in what was read.
+    """
+
+    def __init__(
+            self,
+            words: int,
+            low: int,
+            high: float,
+            confidence: float,
+            size: int,
+            sampled: int,
+            chunks: int,
+            damaged: int = 0):
+        self.words = words
+        self.low = low
+        self.high = high
+        self.confidence = confidence
+        self.size = size
+        self.sampled = sampled
+        self.chunks = chunks
+        self.damaged = damaged
+
+    @property
+    def exact(self) -> bool:
+        return self.sampled >= self.size
+
+    def __repr__(self):
+        return 'Estimate({}, [{}, {}], {} chunks, {}/{} bytes)'.format(
+            self.words, self.low, self.high, self.chunks, self.sampled, self.size)
+
+
+def z_score(confidence: float) -> float:
+    """Get ``z`` such that a normal variable is within ``z`` standard deviations of its mean with a probability of
+    ``confidence``
+    """
+
+    low, high = .0, 10.
+    for i in range(64):
+        z = (low + high) / 2
+        if math.erf(z / math.sqrt(2)) < confidence:
+            low = z
+        else:
+            high = z
+
+    return (low + high) / 2
+
+
+def read_paragraphs(f: BinaryIO, offset: int, length: int, start: int, end: int) -> Tuple[Optional[bytes], int]:
+    """Read the paragraphs of ``f`` which start in ``[offset, offset + length)``, in the part ``[start, end)`` of the
+    file (both bounds being the start of a paragraph).
+    Get them (or ``None``, if no paragraph could be found) along with the number of bytes that were read.
+
+    Since a paragraph is taken whenever it starts in the window (reading further to get its end), all paragraphs
+    are taken with the same probability, whatever their length. If there is no blank line nearby, lines are used
+    instead of paragraphs.
+    """
+
+    read_from = max(start, offset - LOOKBEHIND)
+    limit = min(end, offset + MAX_READ * length)
+    f.seek(read_from)
+
+    data = b''
+    complete = False
+    step = offset + length - read_from  # first the window, then what follows, by smaller steps
+    while not complete:
+        read = f.read(min(step, limit - read_from - len(data)))
+        data += read
+        complete = len(read) == 0 or read_from + len(data) >= limit
+        step = max(1, length // 4)
+
+        for separator in ([BLANK_LINE, NEWLINE] if complete else [BLANK_LINE]):
+            points = [read_from + m.end() for m in separator.finditer(data)]
+            if read_from == start:
+                points.insert(0, start)
+            if read_from + len(data) >= end or len(read) == 0:  # end of the part (or of the file)
+                points.append(read_from + len(data))
+
+            first = next((p for p in points if p >= offset), None)
+            if first is not None and first >= offset + length:  # no paragraph starts in the window
+                return b'', len(data)
+
+            last = next((p for p in points if p >= offset + length), None)
+            if first is not None and last is not None:
+                return data[first - read_from:last - read_from], len(data)
+
+    return None, len(data)
+
+
+def balance(text: str) -> str:
+    """Add the ``\\begin`` of the environments which are closed but not opened in ``text``, and the ``\\end`` of those
+    which are opened but not closed, so that a chunk cut in the middle of an environment is counted as if it was whole.
+    """
+
+    opened = []
+    closed = []
+    for match in ENVIRONMENT.finditer(text):
+        name = match.group(2).strip()
+        if match.group(1) == 'begin':
+            opened.append(name)
+        elif len(opened) > 0:
+            if opened[-1] == name:
+                opened.pop()
+        else:
+            closed.append(name)
+
+    return ''.join('\\begin{{{}}}'.format(name) for name in reversed(closed)) \
+        + text \
+        + ''.join('\\end{{{}}}'.format(name) for name in reversed(opened))
+
+
+def count_chunk(chunk: bytes, counter: WordCounter, errors: List[Damaged] = None) -> Tuple[int, int]:
+    """Count the words of ``chunk``, and get them along with the number of bytes that were counted.
+    If the chunk cannot be parsed, its paragraphs are counted one by one, and those which cannot be parsed on their own
+    are left out. If ``errors`` is given, the parser rather recovers from syntax errors, which are added to it, and
+    the damaged parts are left out.
+    """
+
+    if errors is not None:
+        first = len(errors)
+        parser = Parser(balance(chunk.decode('utf-8', 'replace')), lazy=True, recover=True)
+        parser.errors = errors
+        words = counter(parser.parse())
+
+        return words, max(0, len(chunk) - sum(len(error.text.encode('utf-8')) for error in errors[first:]))
+
+    try:
+        return counter(Parser(balance(chunk.decode('utf-8', 'replace')), lazy=True).parse()), len(chunk)
+    except ParserSyntaxError:
+        pass
+
+    words = 0
+    size = len(chunk)
+    for paragraph in BLANK_LINE.split(chunk):
+        try:
+            words += counter(Parser(balance(paragraph.decode('utf-8', 'replace')), lazy=True).parse())
+        except ParserSyntaxError:
+            size -= len(paragraph)
+
+    return words, size
+
+
+def extrapolate(samples: List[Tuple[int, int]], size: int, fraction: float, confidence: float) -> Tuple[float, float]:
+    """Get the estimated number of words in ``size`` bytes, and the margin of its confidence interval, from
+    ``(words, bytes)`` samples (which are a ``fraction`` of the whole)
+    """
+
+    n = len(samples)
+    total_words = sum(w for w, b in samples)
+    total_bytes = sum(b for w, b in samples)
+
+    if size == 0:
+        return .0, .0
+    if total_bytes == 0:
+        return .0, math.inf
+
+    ratio = total_words / total_bytes
+    words = ratio * size
+
+    if n < 2:
+        return words, math.inf
+
+    variance = sum((w - ratio * b) ** 2 for w, b in samples) / (n - 1)
+    correction = max(.0, 1 - fraction)  # finite population
+    deviation = size * math.sqrt(correction * variance / n) / (total_bytes / n)
+
+    return words, z_score(confidence) * deviation
+
+
+def estimate(
+        f: BinaryIO,
+        counter: WordCounter,
+        budget: int = 1 << 20,
+        time_budget: float = None,
+        chunk_size: int = 8192,
+        confidence: float = .95,
+        seed: int = None,
+        recover: bool = False) -> Estimate:
+    """Estimate the number of words of the (binary, UTF-8) file ``f``, by reading about ``budget`` bytes of it, in
+    chunks of ``chunk_size`` bytes, and, if given, stopping after ``time_budget`` seconds (provided that two chunks
+    were counted). If the file fits in the budget, it is counted entirely (and a syntax error is then raised, unless
+    ``recover`` is set).
+    With ``recover``, the parts which cannot be parsed are skipped, as with the ``recover`` option of
+    :class:`pytexcount.parser.Parser`.
+    """
+
+    if not f.seekable():
+        f = io.BytesIO(f.read())
+
+    size = f.seek(0, io.SEEK_END)
+    errors = [] if recover else None
+
+    # beginning and end, counted exactly
+    head, tail = None, None
+    if size > max(budget, 4 * chunk_size):
+        head, read_head = read_paragraphs(f, 0, chunk_size, 0, size)
+        tail, read_tail = read_paragraphs(f, size - chunk_size, chunk_size, 0, size)
+
+    if head is None or tail is None or len(head) + len(tail) >= size:
+        f.seek(0)
+        parser = Parser(f.read().decode('utf-8', 'replace'), lazy=True, recover=recover)
+        words = counter(parser.parse())
+        return Estimate(words, words, words, confidence, size, size, 1, len(parser.errors))
+
+    words = 0
+    unknown = 0  # bytes of the beginning and the end which could not be counted
+    for chunk in [head, tail]:
+        chunk_words, counted = count_chunk(chunk, counter, errors)
+        words += chunk_words
+        unknown += len(chunk) - counted
+
+    # the rest, sampled
+    start = len(head)
+    end = size - len(tail)
+
+    rng = random.Random(seed)
+    n_strata = max(2, budget // chunk_size - 2)
+    stratum_size = (end - start) / n_strata
+
+    samples = []
+    sampled = read_head + read_tail
+    start_time = time.perf_counter()
+
+    for stratum in rng.sample(range(n_strata), n_strata):
+        if sampled + chunk_size > budget and len(samples) >= 2:
+            break
+        if time_budget is not None and time.perf_counter() - start_time > time_budget and len(samples) >= 2:
+            break
+
+        offset = start + int((stratum + rng.random()) * stratum_size)
+        chunk, read = read_paragraphs(f, offset, chunk_size, start, end)
+        sampled += read
+
+        if chunk is not None:
+            chunk_words, counted = count_chunk(chunk, counter, errors)
+            samples.append((chunk_words, counted))
+
+    rest, margin = extrapolate(
+        samples, end - start + unknown, len(samples) * chunk_size / (end - start), confidence)
+
+    return Estimate(
+        round(words + rest),
+        max(words, math.floor(words + rest - margin)),
+        math.ceil(words + rest + margin),
+        confidence,
+        size,
+        sampled,
+        len(samples),
+        len(errors) if recover else 0)
+
+
+def estimate_file(path: str, counter: WordCounter, **kwargs) -> Estimate:
+    """Estimate the number of words of the file at ``path`` (see :func:`estimate` for the options)"""
+
+    with open(path, 'rb') as f:
+        return estimate(f, counter, **kwargs)
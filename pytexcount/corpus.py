@@ -0,0 +1,224 @@
+"""Count the words of a corpus of papers, each of them being an archive (``.tar``, ``.tar.gz``, ``.zip``, or a single
+gzipped TeX file, as arXiv provides) of its TeX sources.
+
+The archives are read as streams, without extracting them. In each, the main file (the one with ``\\documentclass``)
+is found, and the ``\\input`` and ``\\include`` are resolved within the archive.
+"""
+
+import functools
+import gzip
+import os
+import posixpath
+import re
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Iterable, Iterator
+
+from pytexcount.parser import Parser
+from pytexcount.count import WordCounter, Segmenter
+
+
+ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip', '.gz')
+
+DOCUMENTCLASS = re.compile(r'^[^%\n]*\\documentclass', re.MULTILINE)
+BEGIN_DOCUMENT = re.compile(r'^[^%\n]*\\begin\s*\{document\}', re.MULTILINE)
+INCLUDE = re.compile(r'\\(?:input|include|subfile)\s*\{([^{}]*)\}')
+COMMENT = re.compile(r'(?<!\\)%')
+
+MAX_INCLUDE_DEPTH = 16
+
+
+class CorpusError(Exception):
+    pass
+
+
+def read_archive(path: str) -> Dict[str, str]:
+    """Get the TeX files of an archive, as a dictionary ``{name: content}``
+    """
+
+    def decode(content: bytes) -> str:
+        return content.decode('utf-8', 'replace')
+
+    if zipfile.is_zipfile(path):
+        files = {}
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith('.tex'):
+                    files[posixpath.normpath(info.filename)] = decode(archive.read(info))
+
+        return files
+
+    try:
+        files = {}
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith('.tex'):
+                    files[posixpath.normpath(member.name)] = decode(archive.extractfile(member).read())
+
+        return files
+    except tarfile.ReadError:
+        pass
+
+    # not a tar, so maybe a single gzipped file
+    try:
+        with gzip.open(path) as f:
+            return {'main.tex': decode(f.read())}
+    except OSError:
+        raise CorpusError('{} is not a supported archive'.format(path))
+
+
+def find_main(files: Dict[str, str]) -> str:
+    """Find the main file, which contains ``\\documentclass``.
+    If there are more than one, prefer the one(s) with ``\\begin{document}``, then the one closest to the root.
+    """
+
+    candidates = [name for name, content in files.items() if DOCUMENTCLASS.search(content)]
+
+    if len(candidates) == 0:
+        raise CorpusError('no file with \\documentclass')
+
+    return min(
+        candidates,
+        key=lambda name: (BEGIN_DOCUMENT.search(files[name]) is None, name.count('/'), name))
+
+
+def resolve_includes(main: str, files: Dict[str, str]) -> str:
+    """Get the content of ``main``, in which the ``\\input``, ``\\include`` and ``\\subfile`` are replaced by the
+    content of the corresponding file (if it is in ``files``).
+    Paths are relative to the directory of the main file, as TeX does.
+    """
+
+    return _resolve(files[main], files, posixpath.dirname(main), 0)
+
+
+def _resolve(content: str, files: Dict[str, str], root: str, depth: int) -> str:
+    if depth > MAX_INCLUDE_DEPTH:
+        raise CorpusError('too many nested includes')
+
+    def replace(match) -> str:
+        path = posixpath.normpath(posixpath.join(root, match.group(1).strip()))
+        for candidate in [path, path + '.tex']:
+            if candidate in files:
+                return _resolve(files[candidate], files, root, depth + 1)
+
+        return match.group(0)
+
+    lines = []
+    for line in content.splitlines(keepends=True):
+        if '\\' not in line:
+            lines.append(line)
+            continue
+
+        comment = COMMENT.search(line)
+        if comment is None:
+            lines.append(INCLUDE.sub(replace, line))
+        else:
+            lines.append(INCLUDE.sub(replace, line[:comment.start()]) + line[comment.start():])
+
+    return ''.join(lines)
+
+
+def count_paper(
+        path: str,
+        exclude_env: List[str],
+        include_macro: List[str],
+        macro_as_words: List[str],
+        segmenter: Segmenter = None,
+        recover: bool = False) -> dict:
+    """Count the words of the paper in the archive at ``path``.
+    Any error is reported in the result rather than raised, so that a corpus can be processed in one go.
+    With ``recover``, the parts which cannot be parsed are skipped, and their spans are reported in ``damaged``.
+    """
+
+    result = {'archive': path}
+
+    try:
+        files = read_archive(path)
+        main = find_main(files)
+        source = resolve_includes(main, files)
+
+        result['main'] = main
+        result['files'] = len(files)
+        result['size'] = len(source)
+        parser = Parser(source, lazy=True, recover=recover)
+        result['words'] = WordCounter(exclude_env, include_macro, macro_as_words, segmenter=segmenter)(parser.parse())
+        if len(parser.errors) > 0:
+            result['damaged'] = [error.span for error in parser.errors]
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    return result
+
+
+def find_archives(paths: Iterable[str]) -> Iterator[str]:
+    """Get the archives among ``paths``, or inside them if they are directories"""
+
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, directories, filenames in os.walk(path):
+                directories.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(ARCHIVE_EXTENSIONS):
+                        yield os.path.join(directory, filename)
+        else:
+            yield path
+
+
+class CorpusStatistics:
+    def __init__(self):
+        self.papers = 0
+        self.errors = 0
+        self.words = 0
+        self.size = 0
+        self.start = time.perf_counter()
+        self.elapsed = .0
+
+    def add(self, result: dict):
+        self.papers += 1
+        if 'error' in result:
+            self.errors += 1
+        else:
+            self.words += result['words']
+            self.size += result['size']
+
+        self.elapsed = time.perf_counter() - self.start
+
+    def as_dict(self) -> dict:
+        return {
+            'papers': self.papers,
+            'errors': self.errors,
+            'words': self.words,
+            'seconds': round(self.elapsed, 3),
+            'papers_per_second': round(self.papers / self.elapsed, 2) if self.elapsed > 0 else None,
+            'chars_per_second': round(self.size / self.elapsed) if self.elapsed > 0 else None,
+        }
+
+
+def count_corpus(
+        archives: Iterable[str],
+        exclude_env: List[str],
+        include_macro: List[str],
+        macro_as_words: List[str],
+        segmenter: Segmenter = None,
+        recover: bool = False,
+        processes: int = None,
+        chunksize: int = 4) -> Iterator[dict]:
+    """Count the words of each paper in ``archives`` with a pool of ``processes`` (by default, one per CPU),
+    and yield the results in the same order. With ``processes=1``, the papers are counted in this process.
+    """
+
+    count = functools.partial(
+        count_paper,
+        exclude_env=exclude_env,
+        include_macro=include_macro,
+        macro_as_words=macro_as_words,
+        segmenter=segmenter,
+        recover=recover)
+
+    if processes == 1:
+        yield from map(count, archives)
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            yield from executor.map(count, archives, chunksize=chunksize)
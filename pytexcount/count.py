@@ -1,18 +1,101 @@
+import re
 from typing import List
 
 from pytexcount import parser
 from pytexcount.visit_tree import NodeVisitor
 
 
+class Segmenter:
+    """Split text into words, which are separated by spaces
+    """
+
+    def words(self, text: str) -> List[str]:
+        return text.split()
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+# ideographs, kana, and the like, which form a word by themselves
+CJK = \
+    '\u2e80-\u2fdf\u3005-\u3007\u3041-\u3096\u309d-\u309f\u30a0-\u30ff\u31f0-\u31ff' \
+    '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9d\U00020000-\U0003134f'
+
+# CJK punctuation, which acts as a separator
+CJK_PUNCTUATION = '\u3000-\u3004\u3008-\u3020\u3030-\u303f\uff01\uff08\uff09\uff0c\uff0e\uff1a\uff1b\uff1f'
+
+# combining marks, which belong to the previous character
+COMBINING_MARKS = '\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f\u3099\u309a\uff9e\uff9f'
+
+
+class UnicodeSegmenter(Segmenter):
+    """Split text into words, where each CJK character is a word, and where the characters of ``separators``
+    (by default, the TeX tie, ``~``) and CJK punctuation separate words, as spaces do.
+    Combining marks stay with the character they modify.
+
+    Since most texts contain none of these characters, they are first looked for, so that such texts are simply split
+    at spaces.
+    """
+
+    def __init__(self, separators: str = '~'):
+        self.separators = separators
+
+        sep = ''.join(re.escape(c) for c in separators)
+        self.special = re.compile('[{cjk}{punct}{marks}{sep}]'.format(
+            cjk=CJK, punct=CJK_PUNCTUATION, marks=COMBINING_MARKS, sep=sep))
+        self.regex = re.compile(
+            '[{cjk}][{marks}]*|[^\\s{sep}{punct}{cjk}{marks}][^\\s{sep}{punct}{cjk}]*'.format(
+                cjk=CJK, punct=CJK_PUNCTUATION, marks=COMBINING_MARKS, sep=sep))
+
+    def words(self, text: str) -> List[str]:
+        if self.special.search(text) is None:
+            return text.split()
+
+        return self.regex.findall(text)
+
+    def count(self, text: str) -> int:
+        if self.special.search(text) is None:
+            return len(text.split())
+
+        return len(self.regex.findall(text))
+
+
 class WordCounter(NodeVisitor):
-    def __init__(self, exclude_env: List[str], include_macro: List[str], macro_as_words: List[str]):
+    """Count the words of a tree.
+
+    If ``memoize`` is set, the count of each node is kept, so that a node shared in different places of the tree
+    (see the ``intern`` option of :class:`pytexcount.parser.Parser`) is only counted once.
+    The text is split into words by ``segmenter`` (by default, at spaces).
+    """
+
+    def __init__(
+            self,
+            exclude_env: List[str],
+            include_macro: List[str],
+            macro_as_words: List[str],
+            memoize: bool = False,
+            segmenter: Segmenter = None):
         self.exclude_env = frozenset(exclude_env if exclude_env is not None else [])
         self.include_macro = frozenset(include_macro if include_macro is not None else [])
         self.macro_as_words = frozenset(macro_as_words if macro_as_words is not None else [])
 
+        self.memo = {} if memoize else None
+        self.segmenter = segmenter if segmenter is not None else Segmenter()
+
     def __call__(self, node: parser.ParserNode):
         return self.visit(node)
 
+    def visit(self, node, *args, **kwargs):
+        if self.memo is None:
+            return super().visit(node)
+
+        # the node is kept along with its count, so that its id cannot be reused
+        memoized = self.memo.get(id(node))
+        if memoized is None:
+            memoized = self.memo[id(node)] = (node, super().visit(node))
+
+        return memoized[1]
+
     def visit_texdocument(self, node: parser.TeXDocument):
         return sum(self.visit(child) for child in node.children)
 
@@ -45,26 +128,13 @@ class WordCounter(NodeVisitor):
         return 0
 
     def visit_text(self, node: parser.Text):
-        text = node.text
-
-        if len(text) == 0:
-            return 0
-        else:
-            nwords = 0
-            in_word = text[0].isspace()
-
-            for c in text:
-                if c.isspace() and in_word:
-                    in_word = False
-
-                if not c.isspace() and not in_word:
-                    in_word = True
-                    nwords += 1
-
-            return nwords
+        return self.segmenter.count(node.text)
 
     def visit_unaryoperator(self, node):
         return 0
 
     def visit_separator(self, node):
         return 0
+
+    def visit_damaged(self, node):
+        return 0
@@ -0,0 +1,249 @@
+"""Count the words added and removed between two versions of a document.
+
+Both trees are split into sections (at sectioning macros) and paragraphs (at blank lines).
+Paragraphs are compared through their hash, so that identical ones are skipped, and the words are only diffed in the
+paragraphs that changed.
+"""
+
+import difflib
+import hashlib
+import re
+from typing import List, Iterable, Tuple
+
+from pytexcount import parser
+from pytexcount.count import WordCounter
+
+
+SECTIONING = frozenset(
+    name + star for name in [
+        'part', 'chapter', 'section', 'subsection', 'subsubsection', 'paragraph', 'subparagraph'
+    ] for star in ['', '*']
+)
+
+BLANK_LINE = re.compile(r'\n[ \t]*\n')
+
+
+class WordLister(WordCounter):
+    """Same rules as :class:`pytexcount.count.WordCounter`, but get the list of the words rather than their number.
+    A macro counting as a word is listed as ``\\name``.
+    """
+
+    def visit_children(self, children: Iterable[parser.ParserNode]) -> List[str]:
+        words = []
+        for child in children:
+            words.extend(self.visit(child))
+
+        return words
+
+    def visit_texdocument(self, node: parser.TeXDocument):
+        return self.visit_children(node.children)
+
+    def visit_macro(self, node: parser.Macro):
+        words = ['\\' + node.name] if node.name in self.macro_as_words else []
+        if node.name in self.include_macro:
+            words.extend(self.visit_children(node.arguments))
+
+        return words
+
+    def visit_environment(self, node: parser.Environment):
+        if node.name not in self.exclude_env:
+            return self.visit_children(node.children)
+
+        return []
+
+    def visit_argument(self, node: parser.Argument):
+        return self.visit_children(node.children)
+
+    def visit_mathdollarenv(self, node: parser.MathDollarEnv):
+        if not node.double:  # only counts inline equations
+            return self.visit_children(node.children)
+        else:
+            return []
+
+    def visit_enclosed(self, node: parser.Enclosed):
+        return self.visit_children(node.children)
+
+    def visit_escapingsequence(self, node):
+        return []
+
+    def visit_text(self, node: parser.Text):
+        return self.segmenter.words(node.text)
+
+    def visit_unaryoperator(self, node):
+        return []
+
+    def visit_separator(self, node):
+        return []
+
+    def visit_damaged(self, node):
+        return []
+
+
+class Section:
+    """Section of a document, as a list of paragraphs (each of them being a list of words).
+    The part before the first sectioning macro is a section with an empty title.
+    """
+
+    def __init__(self, macro: str = '', title: str = ''):
+        self.macro = macro
+        self.title = title
+        self.paragraphs: List[List[str]] = [[]]
+
+    def key(self) -> tuple:
+        return self.macro, self.title
+
+    def add(self, words: List[str]):
+        self.paragraphs[-1].extend(words)
+
+    def break_paragraph(self):
+        if len(self.paragraphs[-1]) > 0:
+            self.paragraphs.append([])
+
+    def hashes(self) -> List[bytes]:
+        return [hashlib.sha1('\0'.join(words).encode('utf-8', 'surrogatepass')).digest() for words in self.paragraphs]
+
+    def size(self) -> int:
+        return sum(len(words) for words in self.paragraphs)
+
+
+def split(tree: parser.TeXDocument, lister: WordLister) -> List[Section]:
+    """Split a document in sections and paragraphs.
+    The children of the ``document`` environment are considered as being at the top level.
+    """
+
+    sections = [Section()]
+
+    def walk(nodes: Iterable[parser.ParserNode]):
+        for node in nodes:
+            section = sections[-1]
+            if type(node) is parser.Environment and node.name == 'document':
+                section.break_paragraph()
+                walk(node.children)
+                sections[-1].break_paragraph()
+            elif type(node) is parser.Macro and node.name in SECTIONING:
+                mandatory = [argument for argument in node.arguments if not argument.optional]
+                title = ' '.join(lister.visit(mandatory[-1])) if len(mandatory) > 0 else ''
+                section = Section(node.name, title)
+                section.add(lister.visit(node))
+                section.break_paragraph()
+                sections.append(section)
+            elif type(node) is parser.Text:
+                for i, part in enumerate(BLANK_LINE.split(node.text)):
+                    if i > 0:
+                        section.break_paragraph()
+                    section.add(lister.segmenter.words(part))
+            else:
+                section.add(lister.visit(node))
+
+    walk(tree.children)
+    return sections
+
+
+class SectionDiff:
+    def __init__(self, title: str, added: int = 0, removed: int = 0):
+        self.title = title
+        self.added = added
+        self.removed = removed
+
+    @property
+    def net(self) -> int:
+        return self.added - self.removed
+
+    def __repr__(self):
+        return 'SectionDiff({}, +{}, -{})'.format(repr(self.title), self.added, self.removed)
+
+
+def diff_words(old: List[str], new: List[str]) -> SectionDiff:
+    """Word-level difference"""
+
+    result = SectionDiff('')
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag != 'equal':
+            result.removed += i2 - i1
+            result.added += j2 - j1
+
+    return result
+
+
+def diff_sections(old: Section, new: Section) -> SectionDiff:
+    """Paragraph-level difference, in which only the paragraphs that changed are diffed word by word"""
+
+    result = SectionDiff(new.title)
+    matcher = difflib.SequenceMatcher(None, old.hashes(), new.hashes(), autojunk=False)
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+
+        old_words = [word for words in old.paragraphs[i1:i2] for word in words]
+        new_words = [word for words in new.paragraphs[j1:j2] for word in words]
+
+        if tag == 'replace':
+            words_diff = diff_words(old_words, new_words)
+            result.added += words_diff.added
+            result.removed += words_diff.removed
+        else:
+            result.added += len(new_words)
+            result.removed += len(old_words)
+
+    return result
+
+
+def pair_sections(old: List[Section], new: List[Section]) -> List[Tuple[int, int]]:
+    """Pair the sections of ``old`` and ``new`` which have paragraphs in common (in order, each ``new`` section being
+    paired with the following ``old`` one having the most paragraphs in common), as indices.
+    """
+
+    old_hashes = [set(h for h, words in zip(s.hashes(), s.paragraphs) if len(words) > 0) for s in old]
+
+    pairs = []
+    first = 0
+    for j, section in enumerate(new):
+        hashes = set(section.hashes())
+        best, common = -1, 0
+        for i in range(first, len(old)):
+            if len(old_hashes[i] & hashes) > common:
+                best, common = i, len(old_hashes[i] & hashes)
+
+        if best >= 0:
+            pairs.append((best, j))
+            first = best + 1
+
+    return pairs
+
+
+def diff(old: parser.TeXDocument, new: parser.TeXDocument, lister: WordLister) -> List[SectionDiff]:
+    """Get the number of words added and removed in each section, between ``old`` and ``new``.
+    Sections are matched by their sectioning macro and title. Among the others, a section of ``old`` and one of
+    ``new`` which have paragraphs in common (e.g., a section which was renamed) are diffed as well. Otherwise, they
+    count as removed or added. The sections that were removed are reported along with the other, at the place they
+    had in ``old``.
+    """
+
+    old_sections = split(old, lister)
+    new_sections = split(new, lister)
+
+    result = []
+    matcher = difflib.SequenceMatcher(
+        None, [s.key() for s in old_sections], [s.key() for s in new_sections], autojunk=False)
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for k in range(i2 - i1):
+                result.append(diff_sections(old_sections[i1 + k], new_sections[j1 + k]))
+        else:
+            old_block, new_block = old_sections[i1:i2], new_sections[j1:j2]
+            first_old = first_new = 0
+
+            # the sections in between two pairs (and after the last one) count as removed or added
+            for i, j in pair_sections(old_block, new_block) + [(len(old_block), len(new_block))]:
+                for section in old_block[first_old:i]:
+                    result.append(SectionDiff(section.title, removed=section.size()))
+                for section in new_block[first_new:j]:
+                    result.append(SectionDiff(section.title, added=section.size()))
+                if i < len(old_block):
+                    result.append(diff_sections(old_block[i], new_block[j]))
+
+                first_old, first_new = i + 1, j + 1
+
+    return result
@@ -0,0 +1,100 @@
+"""Index of the macros and environments of a document, by name.
+
+It is built by the parser (see the ``index`` option of :class:`pytexcount.parser.Parser`), so that queries such as
+"all the ``\\cite``" or "the words in ``abstract``" do not need to walk the whole tree.
+"""
+
+from typing import Dict, List
+
+from pytexcount import parser
+from pytexcount.count import WordCounter
+
+
+class IndexEntry:
+    """A macro or an environment, and its position in the source, as ``source[start:end]``"""
+
+    def __init__(self, node: parser.ParserNode, start: int, end: int):
+        self.node = node
+        self.start = start
+        self.end = end
+
+    @property
+    def name(self) -> str:
+        return self.node.name
+
+    def __repr__(self):
+        return 'IndexEntry({}, {}, {}, {})'.format(type(self.node).__name__, self.name, self.start, self.end)
+
+
+class NameIndex:
+    def __init__(self, source: str):
+        self.source = source
+        self.macros: Dict[str, List[IndexEntry]] = {}
+        self.environments: Dict[str, List[IndexEntry]] = {}
+        self.entries: List[IndexEntry] = []  # in the order they were added
+
+    def add(self, node: parser.ParserNode, start: int, end: int):
+        """Add ``node`` if it is a macro (other than ``\\begin`` and ``\\end``) or an environment
+        """
+
+        if type(node) is parser.Macro:
+            if node.name in ['begin', 'end']:
+                return
+            entries = self.macros.setdefault(node.name, [])
+        elif type(node) is parser.Environment:
+            entries = self.environments.setdefault(node.name, [])
+        else:
+            return
+
+        entry = IndexEntry(node, start, end)
+        entries.append(entry)
+        self.entries.append(entry)
+
+    def rollback(self, start: int):
+        """Remove the entries which start at or after ``start``.
+        Since a node is added once it is parsed, these are the last ones which were added.
+        """
+
+        while len(self.entries) > 0 and self.entries[-1].start >= start:
+            entry = self.entries.pop()
+            (self.macros if type(entry.node) is parser.Macro else self.environments)[entry.name].pop()
+
+    def select(self, *names: str, macros: bool = True, environments: bool = True) -> List[IndexEntry]:
+        """Get the macros and/or environments with one of the given ``names``, in the order of the document
+        """
+
+        entries = []
+        for name in names:
+            if macros:
+                entries.extend(self.macros.get(name, []))
+            if environments:
+                entries.extend(self.environments.get(name, []))
+
+        entries.sort(key=lambda e: e.start)
+        return entries
+
+    def text(self, entry: IndexEntry) -> str:
+        """Get the source of an entry"""
+
+        return self.source[entry.start:entry.end]
+
+    @staticmethod
+    def count_words(entries: List[IndexEntry], counter: WordCounter) -> int:
+        """Count the words inside the selected entries: the arguments of the macros and the content of the
+        environments (even if ``counter`` would exclude them).
+        Entries which are inside another one are only counted once.
+        """
+
+        total = 0
+        end = -1
+        for entry in sorted(entries, key=lambda e: e.start):
+            if entry.start < end:  # nested in the previous one
+                continue
+
+            end = entry.end
+            if type(entry.node) is parser.Environment:
+                total += sum(counter.visit(child) for child in entry.node.children)
+            else:
+                total += sum(counter.visit(argument) for argument in entry.node.arguments)
+
+        return total
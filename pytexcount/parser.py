@@ -1,4 +1,6 @@
-from typing import List, Iterator, Union
+import bisect
+import re
+from typing import List, Iterator, Optional, Union
 from enum import Enum, unique
 
 
@@ -36,6 +38,37 @@ SYMBOL_TR = {
     '\n': TokenType.NL
 }
 
+# kinds of token: one bit per type (so that a set of kinds is a mask)
+KINDS = {token_type: 1 << i for i, token_type in enumerate(TokenType)}
+TOKEN_TYPES = {kind: token_type for token_type, kind in KINDS.items()}
+
+K_BACKSLASH = KINDS[TokenType.BACKSLASH]
+K_LCBRACE = KINDS[TokenType.LCBRACE]
+K_RCBRACE = KINDS[TokenType.RCBRACE]
+K_LSBRACE = KINDS[TokenType.LSBRACE]
+K_RSBRACE = KINDS[TokenType.RSBRACE]
+K_PERCENT = KINDS[TokenType.PERCENT]
+K_UP = KINDS[TokenType.UP]
+K_DOWN = KINDS[TokenType.DOWN]
+K_AMPERSAND = KINDS[TokenType.AMPERSAND]
+K_SPACE = KINDS[TokenType.SPACE]
+K_NL = KINDS[TokenType.NL]
+K_EOS = KINDS[TokenType.EOS]
+K_CHAR = KINDS[TokenType.CHAR]
+K_DOLLAR = KINDS[TokenType.DOLLAR]
+
+K_EMPTY = K_SPACE | K_NL
+K_TEXT = K_CHAR | K_SPACE | K_NL
+K_OPENING = K_LCBRACE | K_LSBRACE
+K_CLOSING = K_RCBRACE | K_RSBRACE
+K_UNARY = K_UP | K_DOWN
+
+CHAR_KINDS = {char: KINDS[token_type] for char, token_type in SYMBOL_TR.items()}
+CLOSING_KINDS = {K_LCBRACE: K_RCBRACE, K_LSBRACE: K_RSBRACE}
+
+# run of characters which are all text (``CHAR``, ``SPACE`` or ``NL``)
+TEXT = re.compile('[^{}]+'.format(re.escape(''.join(c for c, kind in CHAR_KINDS.items() if not kind & K_TEXT))))
+
 
 class Token:
     def __init__(self, typ_: TokenType, value: str, position: int = -1):
@@ -52,43 +85,74 @@ class Token:
 
 
 class Lexer:
-    def __init__(self, inp):
+    """Read ``inp[start:end]`` (up to the first ``\\0``, if any), one character at a time: the current token is
+    ``input[position]`` (``char``), of kind ``kind`` (see :data:`KINDS`).
+    Positions are relative to the start of ``inp``.
+    """
+
+    def __init__(self, inp: str, start: int = 0, end: int = None):
         self.input = inp
-        self.position = -1
-        self.current_char = None
+        self.end = len(inp) if end is None else end
+        nul = inp.find('\0', start, self.end)
+        if nul >= 0:
+            self.end = nul
 
-        self.next()
+        self.position = start - 1
+        self.char = ''
+        self.kind = K_SPACE
 
-    def next(self):
-        """Go to next token
-        """
+        self._next()
+
+    @property
+    def current_token(self) -> Token:
+        return Token(TOKEN_TYPES[self.kind], self.char, self.position)
+
+    def _next(self):
+        """Go to next character"""
 
         self.position += 1
 
-        if self.position >= len(self.input):
-            self.current_char = '\0'
+        if self.position < self.end:
+            self.char = self.input[self.position]
+            self.kind = CHAR_KINDS.get(self.char, K_CHAR)
         else:
-            self.current_char = self.input[self.position]
+            self.position = self.end
+            self.char = '\0'
+            self.kind = K_EOS
+
+    def next(self):
+        """Go to next token
+        """
+
+        self._next()
 
     def tokenize(self) -> Iterator[Token]:
-        while self.current_char != '\0':
-            if self.current_char in SYMBOL_TR:
-                yield Token(SYMBOL_TR[self.current_char], self.current_char, self.position)
-            else:
-                yield Token(TokenType.CHAR, self.current_char, self.position)
-            self.next()
+        while self.kind != K_EOS:
+            yield self.current_token
+            self._next()
 
-        yield Token(TokenType.EOS, '\0', self.position)
+        yield self.current_token
 
 
 class ParserNode:
-    pass
+    # position of the node in the source, as ``(start, end)``, if the parser recorded it
+    span = None
+
+    def structure(self) -> tuple:
+        """Key identifying the structure of the node. Children are identified by ``id()``, so that two nodes share
+        the same key if their children are the same objects (which is the case once they are interned).
+        """
+
+        return type(self),
 
 
 class NodeWithChildren(ParserNode):
     def __init__(self, children: List[ParserNode]):
         self.children = children
 
+    def structure(self) -> tuple:
+        return type(self), tuple(map(id, self.children))
+
 
 class TeXDocument(NodeWithChildren):
     """First node type"""
@@ -101,6 +165,9 @@ class Text(ParserNode):
     def __init__(self, text: str):
         self.text = text
 
+    def structure(self) -> tuple:
+        return Text, self.text
+
 
 class Enclosed(NodeWithChildren):
     """Node enclosed with either [R|C]BRACES"""
@@ -116,14 +183,57 @@ class Enclosed(NodeWithChildren):
     def closing(self):
         return TokenType.RCBRACE if self.opening == TokenType.LCBRACE else TokenType.RSBRACE
 
+    def structure(self) -> tuple:
+        return type(self), self.opening, tuple(map(id, self.children))
+
+
+class Deferred:
+    """Children which are not parsed yet: they will be, from ``inp[start:end]``, when first needed"""
+
+    def __init__(self, parser: 'Parser', start: int, end: int):
+        self.parser = parser
+        self.start = start
+        self.end = end
+
+    def source(self) -> str:
+        return self.parser.input[self.start:self.end]
+
+    def parse(self) -> List[ParserNode]:
+        return self.parser.sub_parser(self.start, self.end).sequence()
+
+
+class LazyChildren:
+    """Children of a node, which may be :class:`Deferred`, and are then parsed when first accessed"""
+
+    def __get__(self, node, owner=None):
+        if node is None:
+            return self
+
+        children = node._children
+        if type(children) is Deferred:
+            children = node._children = children.parse()
+
+        return children
+
+    def __set__(self, node, children):
+        node._children = children
+
 
 class Argument(Enclosed):
     """Argument of a macro or an environment, may be optional or not"""
 
-    def __init__(self, children: List[ParserNode], optional: bool = False):
+    children = LazyChildren()
+
+    def __init__(self, children: Union[List[ParserNode], Deferred], optional: bool = False):
         super().__init__(opening=TokenType.LSBRACE if optional else TokenType.LCBRACE, children=children)
         self.optional = optional
 
+    def structure(self) -> tuple:
+        if type(self._children) is Deferred:
+            return Argument, self.optional, Deferred, self._children.source()
+
+        return Argument, self.optional, tuple(map(id, self.children))
+
 
 class UnaryOperator(NodeWithChildren):
     """``_`` and ``^``"""
@@ -136,15 +246,27 @@ class UnaryOperator(NodeWithChildren):
 
         self.operator = op
 
+    def structure(self) -> tuple:
+        return UnaryOperator, self.operator, tuple(map(id, self.children))
+
 
 class Environment(NodeWithChildren):
     """Environment, defined as ``\\begin{name}[optarg1]{arg1} (...) \\end{name}``"""
-    def __init__(self, name: str, arguments: List[Argument], children: List[ParserNode]):
+
+    children = LazyChildren()
+
+    def __init__(self, name: str, arguments: List[Argument], children: Union[List[ParserNode], Deferred]):
         super().__init__(children)
 
         self.name = name
         self.arguments = arguments
 
+    def structure(self) -> tuple:
+        if type(self._children) is Deferred:
+            return Environment, self.name, tuple(map(id, self.arguments)), Deferred, self._children.source()
+
+        return Environment, self.name, tuple(map(id, self.arguments)), tuple(map(id, self.children))
+
 
 class Macro(ParserNode):
     """Macro, defined as ``\\name[optarg1]{arg1}{arg2}``"""
@@ -152,18 +274,35 @@ class Macro(ParserNode):
         self.name = name
         self.arguments = arguments
 
+    def structure(self) -> tuple:
+        return Macro, self.name, tuple(map(id, self.arguments))
+
 
 class EscapingSequence(ParserNode):
     """One letter escaping sequence of the form ``\\x``, where ``x`` is a special character"""
     def __init__(self, to_escape: str):
         self.to_escape = to_escape
 
+    def structure(self) -> tuple:
+        return EscapingSequence, self.to_escape
+
 
 class Separator(ParserNode):
     """Just &"""
     pass
 
 
+class Damaged(ParserNode):
+    """Part of the source which could not be parsed (in recovery mode), along with the error, which was met at
+    ``position``
+    """
+
+    def __init__(self, text: str, error: str, position: int):
+        self.text = text
+        self.error = error
+        self.position = position
+
+
 class MathDollarEnv(NodeWithChildren):
     """Math ``$x$`` env
     """
@@ -172,53 +311,277 @@ class MathDollarEnv(NodeWithChildren):
         super().__init__(children)
         self.double = double
 
+    def structure(self) -> tuple:
+        return MathDollarEnv, self.double, tuple(map(id, self.children))
+
 
 class ParserSyntaxError(Exception):
     pass
 
 
-class Parser:
-    def __init__(self, inp: str):
-        self.lexer = Lexer(inp)
-        self.tokenizer = self.lexer.tokenize()
-        self.current_token: Token = None
+MACRO_NAME = re.compile(r'(?:[^\W_]|[*@])+')  # ``[^\W_]`` is ``str.isalnum()``
 
-        self.next()
+RESYNC = re.compile(r'\n[ \t]*\n|\\(?:end|part|chapter|(?:sub)*section|(?:sub)?paragraph)\*?(?![^\W_]|[*@])')
+ENV_END = re.compile(r'\\end(?:[ \t\n]|%[^\n]*\n)*[{\[]((?:[^\\{}\[\]%$^_&]|%[^\n]*\n)+)[}\]]')
+COMMENTS = re.compile(r'%[^\n]*')
 
-    def _next(self):
-        """Get next token"""
+SCAN_SPECIAL = re.compile(r'[\\{}\[\]%$\0]')
+SCAN_EMPTY = re.compile(r'(?:[ \t\n]|%[^\n]*\n)*')
+SCAN_ENV_DELIMITER = re.compile(r'(?:[ \t\n]|%[^\n]*\n)*([{\[])([^\\{}\[\]%^_&$\0]+)([}\]])')
 
-        try:
-            self.current_token = next(self.tokenizer)
-        except StopIteration:
-            self.current_token = Token(TokenType.EOS, '\0')
+SCAN_OPENING = {'}': '{', ']': '['}
+
+
+def resync(inp: str, position: int, end: int) -> int:
+    """Get the next point (after ``position``) where parsing can safely continue after an error: the end of the
+    paragraph, or the next ``\\end`` or sectioning macro (which are not in a comment).
+    """
+
+    checked = inp.rfind('\n', 0, position) + 1  # there is no comment between the start of the line and there
+
+    while True:
+        match = RESYNC.search(inp, position, end)
+        if match is None:
+            return end
+
+        if match.group()[0] == '\n':
+            return match.end()
+
+        # as for the parser, any ``%`` (even ``\\%``) starts a comment, up to the end of the line
+        start = match.start()
+        checked = max(checked, inp.rfind('\n', checked, start) + 1)
+        if inp.find('%', checked, start) >= 0:
+            position = checked = inp.find('\n', start, end)
+            if position < 0:
+                return end
+            continue
+
+        checked = start
+
+        # ... and ``\\\\`` is an escaping sequence
+        backslash = start
+        while backslash > 0 and inp[backslash - 1] == '\\':
+            backslash -= 1
+
+        if (start - backslash) % 2 == 0:
+            return start
+
+        position = match.end()
+
+
+def scan(inp: str, position: int, end: int, stack: list) -> Optional[int]:
+    """Find where the groups in ``stack`` are closed, by only matching braces, brackets, dollars and environments,
+    starting at ``position``.
+    ``stack`` contains opening characters (``{``, ``[``, ``$`` or ``$$``) or the name of an environment, as
+    ``(Environment, name)``.
+
+    Get the position of the closing character (or of the backslash of ``\\end``), or ``None`` if the input is
+    not well-formed, or is unusual enough that the parser should rather handle it.
+    """
+
+    while True:
+        match = SCAN_SPECIAL.search(inp, position, end)
+        if match is None:
+            return None
+
+        i = match.start()
+        c = inp[i]
+
+        if c == '\\':
+            if i + 1 >= end:
+                return None
+
+            name = MACRO_NAME.match(inp, i + 1, end)
+            if name is None:  # escaping sequence (if ``%``, the comment is skipped and the newline is escaped)
+                position = i + 1 if inp[i + 1] == '%' else i + 2
+                continue
+
+            position = name.end()
+            if name.group() not in ['begin', 'end']:
+                continue
+
+            delimiter = SCAN_ENV_DELIMITER.match(inp, position, end)
+            if delimiter is None:
+                after = SCAN_EMPTY.match(inp, position, end).end()
+                if after < end and inp[after] in '{[':  # an argument which is not a simple name
+                    return None
+                continue
+
+            if SCAN_OPENING[delimiter.group(3)] != delimiter.group(1):
+                return None
+
+            after = SCAN_EMPTY.match(inp, delimiter.end(), end).end()
+            if after < end and inp[after] in '{[':  # more than one argument, so not an environment
+                continue
+
+            position = delimiter.end()
+            env = (Environment, delimiter.group(2).strip())
+
+            if name.group() == 'begin':
+                stack.append(env)
+            elif stack[-1] == env:
+                stack.pop()
+                if len(stack) == 0:
+                    return i
+        elif c == '%':
+            position = inp.find('\n', i, end)
+            if position < 0:
+                return None
+        elif c in '{[':
+            stack.append(c)
+            position = i + 1
+        elif c in '}]':
+            if stack[-1] != SCAN_OPENING[c]:
+                return None
+
+            stack.pop()
+            if len(stack) == 0:
+                return i
+
+            position = i + 1
+        elif c == '$':
+            double = inp.startswith('$$', i, end)
+            if stack[-1] == '$':
+                stack.pop()
+                position = i + 1
+            elif stack[-1] == '$$':
+                if not double:
+                    return None
+                stack.pop()
+                position = i + 2
+            else:
+                stack.append('$$' if double else '$')
+                position = i + 2 if double else i + 1
+                continue
+
+            if len(stack) == 0:
+                return i
+        else:  # the lexer stops at ``\0``
+            return None
+
+
+class Parser(Lexer):
+    """Parse a TeX document, as read by the lexer (comments are skipped).
+
+    If ``intern`` is set, structurally identical subtrees are shared (hash-consing): the first node of a given
+    structure is kept and reused each time the same structure is found again.
+    This saves memory on repetitive documents, but the nodes of such a tree should **not** be modified.
+
+    If ``index`` is given (a :class:`pytexcount.index.NameIndex`), the macros and environments are added to it, along
+    with their position in the source.
+
+    If ``spans`` is set, the position of each node in the source is recorded in its ``span`` attribute.
+    Since interned nodes appear at different positions, ``spans`` and ``intern`` are mutually exclusive.
+
+    If ``lazy`` is set, the children of arguments and environments are not parsed: their source is only matched
+    (braces, brackets, dollars and environments), and they are parsed when first accessed.
+    Parts of the tree which are never visited (such as the arguments of most macros, when counting) are thus never
+    parsed. Since the index is built while parsing, ``index`` and ``lazy`` are mutually exclusive.
+
+    If ``recover`` is set, syntax errors are not raised. Instead, the part of the source which could not be parsed is
+    skipped up to the next safe point (see :func:`resync`), and replaced by a :class:`Damaged` node, which is also
+    added to ``errors``. The positions where an error was met are remembered, so that no part of the source is
+    parsed twice because of the same error.
+    The input is first parsed as usual, and only parsed again with recovery if that fails (so that a well-formed input
+    gives the same tree with and without recovery). Then, a group (``{``, ``[`` or ``$``) which is not closed before the
+    next safe point, or which is nested too deeply, is also considered as an error.
+
+    Only ``inp[start:end]`` is parsed, if given.
+    """
+
+    def __init__(
+            self,
+            inp: str,
+            intern: bool = False,
+            index=None,
+            spans: bool = False,
+            lazy: bool = False,
+            recover: bool = False,
+            start: int = 0,
+            end: int = None):
+
+        if intern and spans:
+            raise ValueError('cannot record the spans of interned nodes')
+        if lazy and index is not None:
+            raise ValueError('cannot build an index in lazy mode')
+
+        super().__init__(inp, start, end)
+
+        self.interned = {} if intern else None
+        self.index = index
+        self.spans = spans
+        self.lazy = lazy
+        self.recover = recover
+        self.recovering = False  # set once the input failed to parse without recovery (see :meth:`sequence`)
+        self.errors: List[Damaged] = []
+        self.failed = {}  # start -> (error, position)
+        self.environment_ends = None  # name -> positions of ``\end{name}``
+        self.last_safe_point = (0, 0)  # position, next safe point from there
+        self.closed_until = 0  # end of the last group which was checked (the groups inside are closed as well)
+
+        # end of the last token which was not a space
+        self.last_end = 0
+
+        self.seek(start)
+
+    def seek(self, position: int):
+        """Continue at ``position``, but skip comment"""
+
+        self.position = position - 1
+        self._next()
+
+        if self.kind == K_PERCENT:
+            newline = self.input.find('\n', self.position, self.end)
+            self.position = (self.end if newline < 0 else newline) - 1
+            self._next()
 
     def next(self):
         """Get next token, but skip comment"""
 
-        self._next()
+        if not self.kind & K_EMPTY:
+            self.last_end = self.position + 1
 
-        if self.current_token.type == TokenType.PERCENT:
-            self.next()
-            while self.current_token.type not in [TokenType.NL, TokenType.EOS]:
-                self._next()
+        self.seek(self.position + 1)
 
     def eat(self, typ: TokenType):
-        if self.current_token.type == typ:
+        self.eat_kind(KINDS[typ])
+
+    def eat_kind(self, kind: int):
+        if self.kind == kind:
             self.next()
         else:
-            raise ParserSyntaxError('expected {}, got {}'.format(typ, self.current_token))
+            raise ParserSyntaxError('expected {}, got {}'.format(TOKEN_TYPES[kind], self.current_token))
 
     def skip_empty(self):
         """Skip spaces, newlines and comments
         """
 
-        while self.current_token.type in [TokenType.SPACE, TokenType.NL]:
+        while self.kind & K_EMPTY:
             self.next()
 
+    def sub_parser(self, start: int, end: int) -> 'Parser':
+        """Get a parser for ``inp[start:end]``, with the same options (and sharing the interned nodes)
+        """
+
+        parser = Parser(self.input, spans=self.spans, lazy=self.lazy, recover=self.recover, start=start, end=end)
+        parser.interned = self.interned
+        parser.errors = self.errors
+        parser.environment_ends = self.environment_ends
+
+        return parser
+
     def parse(self) -> TeXDocument:
         return self.tex_document()
 
+    def intern(self, node: ParserNode) -> ParserNode:
+        """Get the node with the same structure as ``node`` if any was already met, ``node`` otherwise
+        """
+
+        if self.interned is None:
+            return node
+
+        return self.interned.setdefault(node.structure(), node)
+
     @staticmethod
     def is_valid__for_env(macro: Macro, name: str = 'begin') -> bool:
         if type(macro) is not Macro:
@@ -236,50 +599,171 @@ class Parser:
 
     def child(self) \
             -> Union[Text, Macro, MathDollarEnv, Enclosed, EscapingSequence, UnaryOperator, Environment, Separator]:
-        if self.current_token.type == TokenType.BACKSLASH:
-            macro = self.escape_or_macro()
-            if Parser.is_valid__for_env(macro):
-                return self.environment(macro)
+        start = self.position
+        kind = self.kind
+
+        if self.failed and start in self.failed:
+            return self.damaged(start, *self.failed[start])
+
+        try:
+            if kind == K_BACKSLASH:
+                node = self.escape_or_macro()
+                if Parser.is_valid__for_env(node):
+                    node = self.environment(node)
+            elif kind == K_DOLLAR:
+                node = self.math_environment()
+            elif kind & K_OPENING:
+                node = self.enclosed()
+            elif kind & K_UNARY:
+                node = self.unary_operator()
+            elif kind == K_AMPERSAND:
+                self.next()
+                node = Separator()
+            elif kind & K_CLOSING:
+                raise ParserSyntaxError('unexpected {}'.format(self.current_token))
             else:
-                return macro
-        elif self.current_token.type == TokenType.DOLLAR:
-            return self.math_environment()
-        elif self.current_token.type in [TokenType.LCBRACE, TokenType.LSBRACE]:
-            return self.enclosed()
-        elif self.current_token.type in [TokenType.UP, TokenType.DOWN]:
-            return self.unary_operator()
-        elif self.current_token.type == TokenType.AMPERSAND:
-            self.next()
-            return Separator()
-        else:
-            return self.text()
+                node = self.text()
+        except (ParserSyntaxError, RecursionError) as e:
+            if not self.recovering:
+                raise
 
-    def tex_document(self) -> TeXDocument:
-        """Get a document"""
+            error = 'too many nested groups' if type(e) is RecursionError else str(e)
+            self.failed[start] = error, self.position
+            return self.damaged(start, error, self.position)
+
+        node = self.intern(node)
+
+        if self.index is not None or self.spans:
+            end = self.last_end if self.last_end > start else self.position  # only spaces
+            if self.index is not None:
+                self.index.add(node, start, end)
+            if self.spans:
+                node.span = (start, end)
+
+        return node
+
+    def damaged(self, start: int, error: str, position: int) -> Damaged:
+        """Skip from ``start`` to the next safe point, and get the corresponding node
+        """
+
+        end = resync(self.input, start + 1, self.end)
+
+        node = Damaged(self.input[start:end], error, position)
+        node.span = (start, end)
+
+        # the errors met in the part which is skipped or parsed again do not matter anymore (they were the last ones)
+        while len(self.errors) > 0 and start <= self.errors[-1].span[0] < self.position:
+            self.errors.pop()
+
+        self.errors.append(node)
+
+        # same for the macros and environments which were indexed there
+        if self.index is not None:
+            self.index.rollback(start)
+
+        self.seek(end)
+        self.last_end = end
+
+        return node
+
+    def has_end(self, name: str) -> bool:
+        """Check if there is any ``\\end{name}`` after the current position (otherwise, an environment cannot be
+        closed)
+        """
+
+        if self.environment_ends is None:
+            self.environment_ends = {}
+            for match in ENV_END.finditer(self.input):
+                self.environment_ends.setdefault(COMMENTS.sub('', match.group(1)).strip(), []).append(match.start())
+
+        positions = self.environment_ends.get(name, [])
+        i = bisect.bisect_left(positions, self.position)
+
+        return i < len(positions) and positions[i] < self.end
+
+    def check_closed(self, opening: str):
+        """When recovering, fail at once if the group which ``opening`` starts at the current position is not closed
+        before the next safe point (otherwise, it would be parsed up to EOS, and then again after the error)
+        """
+
+        if not self.recovering:
+            return
+
+        start = self.position + len(opening)
+        if start < self.closed_until:
+            return
+
+        closing = scan(self.input, start, self.next_safe_point(start), [opening])
+        if closing is None:
+            raise ParserSyntaxError('{} is not closed before the next safe point'.format(opening))
+
+        self.closed_until = closing
+
+    def next_safe_point(self, position: int) -> int:
+        """Get ``resync(self.input, position, self.end)``, for ``position`` just after an opening character.
+        Since there is no safe point between two such positions of the same paragraph, the last one is reused.
+        """
+
+        start, end = self.last_safe_point
+        if not start <= position < end:
+            self.last_safe_point = position, resync(self.input, position, self.end)
+
+        return self.last_safe_point[1]
+
+    def sequence(self) -> List[ParserNode]:
+        """Get all the nodes, up to EOS.
+        In recovery mode, they are first parsed without recovery, and parsed again with recovery if that fails.
+        """
+
+        if self.recover and not self.recovering:
+            start, last_end = self.position, self.last_end
+            try:
+                return self.nodes()
+            except (ParserSyntaxError, RecursionError):
+                if self.index is not None:
+                    self.index.rollback(start)
+
+                self.recovering = True
+                self.seek(start)
+                self.last_end = last_end
+
+        return self.nodes()
+
+    def nodes(self) -> List[ParserNode]:
+        """Get all the nodes, up to EOS, as they are"""
 
         children = []
-        while self.current_token.type != TokenType.EOS:
+        while self.kind != K_EOS:
             children.append(self.child())
 
-        self.eat(TokenType.EOS)
-        return TeXDocument(children)
+        self.eat_kind(K_EOS)
+        return children
+
+    def tex_document(self) -> TeXDocument:
+        """Get a document"""
+
+        document = TeXDocument(self.sequence())
+        if self.spans:
+            document.span = (0, len(self.input))
+
+        return document
 
     def escape_or_macro(self) -> Union[Macro, EscapingSequence]:
         """After a BACKSLASH could be either an escaping sequence or a macro
         """
 
-        self.eat(TokenType.BACKSLASH)
+        self.eat_kind(K_BACKSLASH)
 
         name = ''
-
-        while self.current_token.type == TokenType.CHAR:
-            if not self.current_token.value.isalnum() and self.current_token.value not in ['*', '@']:
-                break
-            name += self.current_token.value
-            self.next()
+        if self.kind == K_CHAR:
+            match = MACRO_NAME.match(self.input, self.position, self.end)
+            if match is not None:
+                name = match.group()
+                self.last_end = match.end()
+                self.seek(match.end())
 
         if name == '':  # that's escaping
-            val = self.current_token.value
+            val = self.char
             self.next()
             return EscapingSequence(val)
         else:  # macro, then
@@ -292,68 +776,98 @@ class Parser:
 
         self.skip_empty()
         arguments = []
-        while self.current_token.type in [TokenType.LCBRACE, TokenType.LSBRACE]:
-            enclosed = self.enclosed()
-            arguments.append(Argument(enclosed.children, enclosed.opening == TokenType.LSBRACE))
+        while self.kind & K_OPENING:
+            start = self.position
+            argument = self.lazy_argument() if self.lazy else None
+            if argument is None:
+                enclosed = self.enclosed()
+                argument = Argument(enclosed.children, enclosed.opening == TokenType.LSBRACE)
+
+            argument = self.intern(argument)
+            if self.spans:
+                argument.span = (start, self.last_end)
+
+            arguments.append(argument)
             self.skip_empty()
 
         return arguments
 
+    def lazy_argument(self) -> Optional[Argument]:
+        """Get an argument, the children of which are deferred (or ``None`` if the scan failed)
+        """
+
+        start = self.position + 1
+        opening = self.kind
+        end = self.next_safe_point(start) if self.recover else self.end  # see :meth:`check_closed`
+        closing = scan(self.input, start, end, [self.char])
+
+        if closing is None:
+            return None
+
+        self.seek(closing)
+        self.eat_kind(CLOSING_KINDS[opening])
+
+        return Argument(Deferred(self, start, closing), opening == K_LSBRACE)
+
     def enclosed(self) -> Enclosed:
         """Get enclosed
         """
 
-        if self.current_token.type not in [TokenType.LCBRACE, TokenType.LSBRACE]:
+        if not self.kind & K_OPENING:
             raise ParserSyntaxError('not an enclosed, got {}'.format(self.current_token))
 
-        opening = self.current_token.type
-        opposite = {
-            TokenType.LSBRACE: TokenType.RSBRACE,
-            TokenType.LCBRACE: TokenType.RCBRACE}[self.current_token.type]
+        self.check_closed(self.char)
+
+        opening = self.kind
+        opposite = CLOSING_KINDS[opening]
 
         self.next()
 
         children = []
-        while self.current_token.type != TokenType.EOS:
-            if self.current_token.type == opposite:
+        while self.kind != K_EOS:
+            if self.kind == opposite:
                 break
 
             children.append(self.child())
 
-        self.eat(opposite)
-        return Enclosed(opening, children)
+        self.eat_kind(opposite)
+        return Enclosed(TOKEN_TYPES[opening], children)
 
     def text(self) -> Text:
         """Pure text, without env or macro.
         """
 
-        text = ''
-        while self.current_token.type in [
-            TokenType.CHAR, TokenType.SPACE, TokenType.NL
-        ]:
+        parts = []
+        while self.kind & K_TEXT:
+            part = TEXT.match(self.input, self.position, self.end).group()
+            not_empty = len(part.rstrip(' \t\n'))
+            if not_empty > 0:
+                self.last_end = self.position + not_empty
 
-            text += self.current_token.value
-            self.next()
+            parts.append(part)
+            self.seek(self.position + len(part))
 
-        return Text(text)
+        return Text(''.join(parts))
 
     def math_environment(self) -> MathDollarEnv:
-        self.eat(TokenType.DOLLAR)
+        self.check_closed('$$' if self.input.startswith('$$', self.position, self.end) else '$')
+
+        self.eat_kind(K_DOLLAR)
         double = False
-        if self.current_token.type == TokenType.DOLLAR:
+        if self.kind == K_DOLLAR:
             double = True
-            self.eat(TokenType.DOLLAR)
+            self.eat_kind(K_DOLLAR)
 
         children = []
-        while self.current_token.type != TokenType.EOS:
-            if self.current_token.type == TokenType.DOLLAR:
+        while self.kind != K_EOS:
+            if self.kind == K_DOLLAR:
                 break
 
             children.append(self.child())
 
-        self.eat(TokenType.DOLLAR)
+        self.eat_kind(K_DOLLAR)
         if double:
-            self.eat(TokenType.DOLLAR)
+            self.eat_kind(K_DOLLAR)
 
         return MathDollarEnv(children, double=double)
 
@@ -364,8 +878,24 @@ class Parser:
         name = get_name(macro_begin)  # assume that `is_valid_for_env` is True!
         arguments = macro_begin.arguments[1:]
 
+        if self.recovering and not self.has_end(name):  # it would be parsed up to EOS, and then again after the error
+            self.seek(self.end)
+            raise ParserSyntaxError('EOS while parsing environment {}'.format(name))
+
+        if self.lazy and self.kind != K_EOS:
+            start = self.position
+            end = scan(self.input, start, self.end, [(Environment, name)])
+
+            if end is not None:
+                self.seek(end)
+                macro_end = self.escape_or_macro()
+                if not Parser.is_valid__for_env(macro_end, 'end') or get_name(macro_end) != name:
+                    raise ParserSyntaxError('expected \\end{{{}}} at {}'.format(name, end))
+
+                return Environment(name, arguments, Deferred(self, start, end))
+
         children = []
-        while self.current_token.type != TokenType.EOS:
+        while self.kind != K_EOS:
             child = self.child()
             if type(child) is Macro and Parser.is_valid__for_env(child, 'end') and get_name(child) == name:
                 return Environment(name, arguments, children)
@@ -377,26 +907,31 @@ class Parser:
     def unary_operator(self) -> UnaryOperator:
         """Get unary operator"""
 
-        if self.current_token.type not in [TokenType.UP, TokenType.DOWN]:
+        if not self.kind & K_UNARY:
             raise ParserSyntaxError('not an unary, got {}'.format(self.current_token))
 
-        operator = self.current_token.type
+        operator = TOKEN_TYPES[self.kind]
         self.next()
 
         children = []
-        if self.current_token.type == TokenType.LCBRACE:
+        if self.kind == K_LCBRACE:
+            self.check_closed('{')
             self.next()
 
-            while self.current_token.type != TokenType.EOS:
-                if self.current_token.type == TokenType.RCBRACE:
+            while self.kind != K_EOS:
+                if self.kind == K_RCBRACE:
                     break
 
                 children.append(self.child())
 
-            self.eat(TokenType.RCBRACE)
+            self.eat_kind(K_RCBRACE)
+
+        elif self.kind == K_CHAR:  # normally, it can only be CHAR?!?
+            text = self.intern(Text(self.char))
+            if self.spans:
+                text.span = (self.position, self.position + 1)
 
-        elif self.current_token.type == TokenType.CHAR:  # normally, it can only be CHAR?!?
-            children.append(Text(self.current_token.value))
+            children.append(text)
             self.next()
 
         return UnaryOperator(operator, children)
@@ -1,10 +1,17 @@
 import argparse
+import json
+import os
+import subprocess
 import sys
 from typing import List
 
 import pytexcount
-from pytexcount.parser import Parser, ParserSyntaxError
-from pytexcount.count import WordCounter
+from pytexcount.parser import Parser, ParserSyntaxError, TeXDocument, Damaged
+from pytexcount.count import WordCounter, Segmenter, UnicodeSegmenter
+from pytexcount.diff import WordLister, diff
+from pytexcount.corpus import CorpusStatistics, count_corpus, find_archives
+from pytexcount.approx import estimate
+from pytexcount.visit_tree import TextTreeExporter, JSONTreeExporter, JSONLinesTreeExporter
 
 
 INCLUDE_MACRO = [
@@ -38,6 +45,13 @@ MACRO_AS_WORDS = [
 ]
 
 
+TREE_EXPORTERS = {
+    'text': TextTreeExporter,
+    'json': JSONTreeExporter,
+    'jsonl': JSONLinesTreeExporter
+}
+
+
 def make_list(inp):
     if inp == '':
         return []
@@ -45,8 +59,35 @@ def make_list(inp):
         return inp.split(',')
 
 
+def add_counting_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '-i', '--include-macros', type=make_list, help='colon-separated list of macro args to include', default='')
+    parser.add_argument(
+        '-e', '--exclude-env', type=make_list, help='colon-separated list of environments to exclude', default='')
+    parser.add_argument(
+        '-w', '--words', type=make_list, help='colon-separated list of macros that count as word', default='')
+    parser.add_argument(
+        '-u', '--unicode',
+        help='Unicode-aware word segmentation: count each CJK character as a word, and split words at separators',
+        action='store_true')
+    parser.add_argument(
+        '--separators', help='characters that separate words in Unicode mode (default: `%(default)s`)', default='~')
+    parser.add_argument(
+        '-r', '--recover',
+        help='skip the parts which cannot be parsed (up to the end of the paragraph) and report them, rather than '
+             'failing',
+        action='store_true')
+
+
+def get_segmenter(args: argparse.Namespace) -> Segmenter:
+    return UnicodeSegmenter(args.separators) if args.unicode else Segmenter()
+
+
 def get_arguments_parser():
-    parser = argparse.ArgumentParser(description=pytexcount.__doc__)
+    parser = argparse.ArgumentParser(
+        description=pytexcount.__doc__,
+        epilog='Use `%(prog)s diff -h` to compare two versions of a document, '
+               'and `%(prog)s corpus -h` to count the papers of a corpus of archives.')
     parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + pytexcount.__version__)
 
     parser.add_argument(
@@ -56,19 +97,88 @@ def get_arguments_parser():
         default=sys.stdin,
         help='TeX source')
 
+    add_counting_arguments(parser)
+
     parser.add_argument(
-        '-i', '--include-macros', type=make_list, help='colon-separated list of macro args to include', default='')
+        '-s', '--show', help='Show the list of excluded environments and included macro args', action='store_true')
     parser.add_argument(
-        '-e', '--exclude-env', type=make_list, help='colon-separated list of environments to exclude', default='')
+        '-t', '--tree', choices=TREE_EXPORTERS.keys(), help='Output the tree of the document in a given format')
     parser.add_argument(
-        '-w', '--words', type=make_list, help='colon-separated list of macros that count as word', default='')
+        '--approx',
+        help='Estimate the count from samples of the file, and output it with its 95%% confidence interval',
+        action='store_true')
+    parser.add_argument(
+        '--budget', type=int, help='number of bytes to read with --approx (default: %(default)s)', default=1 << 20)
+    parser.add_argument('--time-budget', type=float, help='maximum number of seconds to spend with --approx')
+
+    return parser
+
+
+def get_diff_arguments_parser():
+    parser = argparse.ArgumentParser(
+        prog='pytexcount diff', description='Count the words added and removed between two versions of a document')
+
+    parser.add_argument('old', help='old version, either a file or a git object (`revision:path`)')
+    parser.add_argument('new', help='new version, either a file or a git object (`revision:path`)')
+
+    add_counting_arguments(parser)
 
+    return parser
+
+
+def get_corpus_arguments_parser():
+    parser = argparse.ArgumentParser(
+        prog='pytexcount corpus',
+        description='Count the words of papers in archives (.tar, .tar.gz, .zip, .gz), without extracting them. '
+                    'The results are written as JSON Lines, and statistics are given at the end on stderr.')
+
+    parser.add_argument('archives', nargs='+', help='archives, or directories containing archives')
     parser.add_argument(
-        '-s', '--show', help='Show the list of excluded environments and included macro args', action='store_true')
+        '-j', '--processes', type=int, help='number of processes (default: one per CPU)', default=None)
+
+    add_counting_arguments(parser)
 
     return parser
 
 
+def read_source(source: str) -> str:
+    """Read a file, or a file at a given git revision (``revision:path``, as understood by ``git show``)
+    """
+
+    if os.path.exists(source) or ':' not in source:
+        with open(source) as f:
+            return f.read()
+
+    try:
+        return subprocess.run(
+            ['git', 'show', source], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        ).stdout.decode()
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise Exception('cannot get {} from git: {}'.format(source, getattr(e, 'stderr', b'').decode().strip() or e))
+
+
+def parse(source: str, spans: bool = False, lazy: bool = False, errors: List[Damaged] = None) -> TeXDocument:
+    """Parse ``source``. If ``errors`` is given, recover from syntax errors, which are added to it
+    """
+
+    try:
+        parser = Parser(source, spans=spans, lazy=lazy, recover=errors is not None)
+        if errors is not None:
+            parser.errors = errors
+
+        return parser.parse()
+    except ParserSyntaxError as e:
+        raise Exception('error while parsing: {}'.format(e))
+
+
+def report_damaged(source: str, errors: List[Damaged], name: str = ''):
+    for error in errors:
+        start, end = error.span
+        print('{}damaged, line {} ({}-{}): {}'.format(
+            '{}: '.format(name) if name else '', source.count('\n', 0, start) + 1, start, end, error.error),
+            file=sys.stderr)
+
+
 def show_list(title: str, lst: List[str]):
     print(title, end='')
     for i, element in enumerate(lst):
@@ -82,8 +192,67 @@ def show_list(title: str, lst: List[str]):
     print()
 
 
+def main_diff(argv: List[str]):
+    args = get_diff_arguments_parser().parse_args(argv)
+
+    lister = WordLister(
+        EXCLUDE_ENV + args.exclude_env,
+        INCLUDE_MACRO + args.include_macros,
+        MACRO_AS_WORDS + args.words,
+        segmenter=get_segmenter(args))
+    sources = read_source(args.old), read_source(args.new)
+    errors = [], []
+    sections = diff(
+        *(parse(source, errors=e if args.recover else None) for source, e in zip(sources, errors)), lister)
+
+    for source, name, e in zip(sources, [args.old, args.new], errors):
+        report_damaged(source, e, name)
+
+    added = removed = 0
+    for section in sections:
+        added += section.added
+        removed += section.removed
+        if section.added > 0 or section.removed > 0:
+            print('+{}\t-{}\t{:+d}\t{}'.format(section.added, section.removed, section.net, section.title))
+
+    print('+{}\t-{}\t{:+d}\t(total)'.format(added, removed, added - removed))
+
+
+def main_corpus(argv: List[str]):
+    args = get_corpus_arguments_parser().parse_args(argv)
+
+    statistics = CorpusStatistics()
+    results = count_corpus(
+        find_archives(args.archives),
+        EXCLUDE_ENV + args.exclude_env,
+        INCLUDE_MACRO + args.include_macros,
+        MACRO_AS_WORDS + args.words,
+        segmenter=get_segmenter(args),
+        recover=args.recover,
+        processes=args.processes)
+
+    for result in results:
+        statistics.add(result)
+        print(json.dumps(result), flush=True)
+
+    print(json.dumps(statistics.as_dict()), file=sys.stderr)
+
+
+SUBCOMMANDS = {
+    'diff': main_diff,
+    'corpus': main_corpus
+}
+
+
 def main():
-    args = get_arguments_parser().parse_args()
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        return SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+
+    arguments_parser = get_arguments_parser()
+    args = arguments_parser.parse_args()
+
+    if args.approx and args.tree is not None:
+        arguments_parser.error('--approx cannot output the tree (-t)')
 
     excluded_env = EXCLUDE_ENV + args.exclude_env
     included_macros = INCLUDE_MACRO + args.include_macros
@@ -95,12 +264,34 @@ def main():
         show_list('Words:', macro_as_words)
         return
 
-    try:
-        tree = Parser(args.infile.read()).parse()
-    except ParserSyntaxError as e:
-        raise Exception('error while parsing: {}'.format(e))
+    if args.approx:
+        try:
+            result = estimate(
+                args.infile.buffer,
+                WordCounter(excluded_env, included_macros, macro_as_words, segmenter=get_segmenter(args)),
+                budget=args.budget,
+                time_budget=args.time_budget,
+                recover=args.recover)
+        except ParserSyntaxError as e:
+            raise Exception('error while parsing: {}'.format(e))
+
+        print(result.words if result.exact else '{} [{}, {}]'.format(result.words, result.low, result.high))
+        if result.damaged > 0:
+            print('damaged: {} part(s), which were not counted'.format(result.damaged), file=sys.stderr)
+        return
+
+    # when counting, the parts of the tree which are not counted are never parsed
+    source = args.infile.read()
+    errors = [] if args.recover else None
+    tree = parse(source, spans=args.tree is not None, lazy=args.tree is None, errors=errors)
+
+    if args.tree is not None:
+        TREE_EXPORTERS[args.tree](sys.stdout)(tree)
+    else:
+        print(WordCounter(excluded_env, included_macros, macro_as_words, segmenter=get_segmenter(args))(tree))
 
-    print(WordCounter(excluded_env, included_macros, macro_as_words)(tree))
+    if errors:  # some may only be met while counting, in lazy mode
+        report_damaged(source, errors)
 
 
 if __name__ == '__main__':
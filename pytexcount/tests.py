@@ -1,7 +1,23 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import gzip
+import io
+import json
+import os
+import tarfile
+import tempfile
+import threading
+import time
 import unittest
+import unittest.mock
+import zipfile
 
 import pytexcount.parser as P
-from pytexcount.count import WordCounter
+from pytexcount import aio, approx, corpus, diff
+from pytexcount.index import NameIndex
+from pytexcount import visit_tree
+from pytexcount.count import WordCounter, UnicodeSegmenter
 
 
 class LexerTestCase(unittest.TestCase):
@@ -22,6 +38,19 @@ class LexerTestCase(unittest.TestCase):
             self.assertEqual(token.type, expected[i].type)
             self.assertEqual(token.value, expected[i].value)
 
+    def test_lexer_part(self):
+        # only ``inp[start:end]``, up to ``\0``
+        tokens = list(P.Lexer('a {b}\0c', 2, 7).tokenize())
+        self.assertEqual([t.type for t in tokens], [P.TokenType.LCBRACE, P.TokenType.CHAR, P.TokenType.RCBRACE,
+                                                    P.TokenType.EOS])
+        self.assertEqual([t.position for t in tokens], [2, 3, 4, 5])
+
+        # the kind of the current token is one bit of a mask
+        lexer = P.Lexer('}')
+        self.assertEqual(lexer.kind, P.KINDS[P.TokenType.RCBRACE])
+        self.assertTrue(lexer.kind & P.K_CLOSING)
+        self.assertFalse(lexer.kind & P.K_TEXT)
+
 
 class ParserTestCase(unittest.TestCase):
 
@@ -167,6 +196,242 @@ class ParserTestCase(unittest.TestCase):
         self.assertIsInstance(tree.children[2], P.Text)
         self.assertEqual(tree.children[2].text, aft)
 
+    def test_unexpected_closing(self):
+        for text in ['a } b', 'a ] b', '{a]}', '$a}$']:
+            with self.assertRaises(P.ParserSyntaxError):
+                self.parse(text)
+
+    def test_spans(self):
+        text = 'a \\textbf[o]{b}$x_1$  %c\n\\begin{x}y\\end{x}'
+        tree = P.Parser(text, spans=True).parse()
+
+        self.assertEqual(tree.span, (0, len(text)))
+        self.assertEqual([text[slice(*c.span)] for c in tree.children], [
+            'a', '\\textbf[o]{b}', '$x_1$', '  %c\n', '\\begin{x}y\\end{x}'])
+        self.assertEqual([text[slice(*c.span)] for c in tree.children[1].arguments], ['[o]', '{b}'])
+        self.assertEqual(text[slice(*tree.children[2].children[1].children[0].span)], '1')
+
+        self.assertIsNone(self.parse(text).children[0].span)
+
+        with self.assertRaises(ValueError):
+            P.Parser(text, spans=True, intern=True)
+
+    def test_intern(self):
+        text = '\\textbf{a b} & \\textbf{a b}\\hline\n\\textbf{a b} & \\textbf{a c}\\hline\n'
+
+        tree = self.parse(text)
+        self.assertEqual(len(tree.children), 10)
+        self.assertIsNot(tree.children[0], tree.children[3])
+
+        tree = P.Parser(text, intern=True).parse()
+        self.assertEqual(len(tree.children), 10)
+        self.assertIs(tree.children[0], tree.children[3])
+        self.assertIs(tree.children[0], tree.children[5])
+        self.assertIs(tree.children[4], tree.children[9])
+        self.assertIs(tree.children[1], tree.children[6])
+
+        self.assertIsNot(tree.children[0], tree.children[8])
+        self.assertEqual(tree.children[8].arguments[0].children[0].text, 'a c')
+
+    def test_current_token(self):
+        parser = P.Parser('a%b\n\\x')
+        self.assertEqual(parser.current_token.type, P.TokenType.CHAR)
+
+        parser.next()
+        self.assertEqual((parser.current_token.type, parser.current_token.position), (P.TokenType.NL, 3))
+
+        parser.next()
+        parser.eat(P.TokenType.BACKSLASH)
+        self.assertEqual(parser.current_token.value, 'x')
+
+        with self.assertRaises(P.ParserSyntaxError):
+            parser.eat(P.TokenType.DOLLAR)
+
+        parser.next()
+        self.assertEqual(parser.current_token.type, P.TokenType.EOS)
+
+    def test_lazy(self):
+        def export(tree):
+            f = io.StringIO()
+            visit_tree.TextTreeExporter(f)(tree)
+            return f.getvalue()
+
+        texts = [
+            'a \\textbf[o]{b {c} $\\}$} $x_1$ & \\begin{x}c{d}\\end{x}',
+            '\\begin{x}\\begin{y}\\end{x}\\end{y}\\end {x}%\\end{x}\n\\end{x} \\begin{x}{y}',
+            '\\begin{x}\\end{x}[a]\\end{x}{ $$\\}$$ \\{ $\\$$ }\\end{x}\\% \\end{y} }',
+        ]
+
+        for text in texts:
+            self.assertEqual(export(self.parse(text)), export(P.Parser(text, lazy=True).parse()))
+
+        # not parsed until needed
+        tree = P.Parser('\\textbf{a \\emph{b}} \\begin{x}c\\end{x}', lazy=True).parse()
+        argument = tree.children[0].arguments[0]
+        self.assertIs(type(argument._children), P.Deferred)
+        self.assertIs(type(tree.children[1]._children), P.Deferred)
+
+        self.assertEqual(argument.children[1].name, 'emph')
+        self.assertIs(type(argument._children), list)
+        self.assertIs(type(argument.children[1].arguments[0]._children), P.Deferred)
+
+        self.assertEqual(WordCounter(['x'], [], [])(tree), 0)
+        self.assertIs(type(tree.children[1]._children), P.Deferred)
+
+        # errors are the same as when not lazy
+        for text in ['\\textbf{a', '\\textbf{a]}', '\\begin{x} a', '\\begin{x}\\end{x']:
+            with self.assertRaises(P.ParserSyntaxError):
+                P.Parser(text, lazy=True).parse()
+
+        with self.assertRaises(ValueError):
+            P.Parser('', lazy=True, index=NameIndex(''))
+
+    def test_recover(self):
+        text = 'a b } c d\n\ne \\emph{f\n\n\\section{g} h'
+
+        with self.assertRaises(P.ParserSyntaxError):
+            P.Parser(text).parse()
+
+        for lazy in [False, True]:
+            parser = P.Parser(text, recover=True, lazy=lazy)
+            tree = parser.parse()
+            self.assertEqual(WordCounter([], ['section', 'emph'], [])(tree), 5)
+            self.assertEqual([e.span for e in parser.errors], [(4, 11), (13, 22)])
+            self.assertEqual(parser.errors[0].text, '} c d\n\n')
+            self.assertEqual(parser.errors[1].position, text.index('{f'))
+
+        # resync at the next `\end` or section (but not in a comment), and nothing changes if the input is correct
+        text = '\\begin{x}a { b % \\end{x}\n\\end{x} c \\begin{y}d \\subsection*{e}f'
+        parser = P.Parser(text, recover=True)
+        tree = parser.parse()
+        self.assertEqual([e.span for e in parser.errors], [(11, 25), (35, 46)])
+        self.assertEqual(type(tree.children[0]), P.Environment)
+        self.assertEqual(type(tree.children[-2]), P.Macro)
+
+        parser = P.Parser('\\begin{x}a {b}\\end{x}', recover=True)
+        self.assertEqual(parser.parse().children[0].children[1].children[0].text, 'b')
+        self.assertEqual(parser.errors, [])
+
+        # as for the parser, `\%` starts a comment
+        text = 'a } \\% \\section{x}\n\\section{y} b'
+        parser = P.Parser(text, recover=True)
+        self.assertEqual(WordCounter([], ['section'], [])(parser.parse()), 3)
+        self.assertEqual([e.span for e in parser.errors], [(2, text.index('\\section{y}'))])
+
+        # unclosed environments are not parsed again and again
+        text = ''.join('\\begin{{e{}}} word word\n\n'.format(i) for i in range(200))
+        for lazy in [False, True]:
+            with unittest.mock.patch.object(P.Parser, 'child', autospec=True, side_effect=P.Parser.child) as child:
+                parser = P.Parser(text, recover=True, lazy=lazy)
+                self.assertEqual(WordCounter([], [], [])(parser.parse()), 0)
+            self.assertEqual(len(parser.errors), 200)
+            self.assertEqual(len(parser.failed), 200)
+            self.assertLess(child.call_count, 5 * 200)
+
+        # nor are unclosed groups (which would otherwise also be nested in each other)
+        text = ''.join('word \\textbf{{a b{}\n\n'.format('$' * (i % 2)) for i in range(400))
+        for lazy in [False, True]:
+            with unittest.mock.patch.object(P.Parser, 'child', autospec=True, side_effect=P.Parser.child) as child:
+                parser = P.Parser(text, recover=True, lazy=lazy)
+                self.assertEqual(WordCounter([], [], [])(parser.parse()), 400)
+            self.assertEqual(len(parser.errors), 400)
+            self.assertLess(child.call_count, 3 * 400)
+
+        # but a group is only required to close before the next safe point if the input is not well-formed
+        text = 'a {b\n\nc} d'
+        self.assertEqual(WordCounter([], [], [])(P.Parser(text, recover=True).parse()), 4)
+        self.assertEqual(WordCounter([], [], [])(P.Parser(text + ' }', recover=True).parse()), 2)
+
+        # deeply nested groups
+        parser = P.Parser('{' * 2000 + 'a' + '}' * 2000 + '\n\nb', recover=True)
+        self.assertEqual(WordCounter([], [], [])(parser.parse()), 1)
+        self.assertEqual(len(parser.errors), 1)
+
+
+class ExportTestCase(unittest.TestCase):
+
+    TEXT = 'a \\textbf[o]{b} $x_1$ & \\begin{x}c{d}\\end{x}'
+
+    def setUp(self):
+        self.tree = P.Parser(self.TEXT, spans=True).parse()
+
+    def test_text(self):
+        expected = '\n'.join([
+            '+ TexDocument::',
+            '|  + Text: `a `',
+            '|  + Macro (textbf)::',
+            '|  |  + Argument (optional)::',
+            '|  |  |  + Text: `o`',
+            '|  |  + Argument (mandatory)::',
+            '|  |  |  + Text: `b`',
+            '|  + MathEnvironment ($)::',
+            '|  |  + Text: `x`',
+            '|  |  + Unary operator (TokenType.DOWN)::',
+            '|  |  |  + Text: `1`',
+            '|  + Text: ` `',
+            '|  + Separator',
+            '|  + Text: ` `',
+            '|  + Environment (x)::',
+            '|  |  + Text: `c`',
+            '|  |  + Enclosing (TokenType.LCBRACE)::',
+            '|  |  |  + Text: `d`',
+            ''
+        ])
+
+        f = io.StringIO()
+        visit_tree.TextTreeExporter(f, buffer_size=16)(self.tree)
+        self.assertEqual(f.getvalue(), expected)
+
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            visit_tree.PrintTreeStructure()(self.tree)
+        self.assertEqual(f.getvalue(), expected)
+
+    def test_json(self):
+        f = io.StringIO()
+        visit_tree.JSONTreeExporter(f, buffer_size=16)(self.tree)
+        tree = json.loads(f.getvalue())
+
+        self.assertEqual(tree['type'], 'TeXDocument')
+        self.assertEqual(len(tree['children']), 7)
+        macro = tree['children'][1]
+        self.assertEqual((macro['type'], macro['name'], macro['span']), ('Macro', 'textbf', [2, 15]))
+        self.assertEqual(macro['children'][0], {'type': 'Argument', 'optional': True, 'span': [9, 12], 'children': [
+            {'type': 'Text', 'text': 'o', 'span': [10, 11]}]})
+        self.assertNotIn('children', tree['children'][4])
+
+        f = io.StringIO()
+        visit_tree.JSONLinesTreeExporter(f)(self.tree)
+        lines = [json.loads(line) for line in f.getvalue().splitlines()]
+
+        self.assertEqual(len(lines), 18)
+        self.assertEqual(lines[2], {'type': 'Macro', 'name': 'textbf', 'span': [2, 15], 'depth': 1})
+        self.assertEqual(lines[-4]['name'], 'x')
+        self.assertEqual(lines[-1], {'type': 'Text', 'text': 'd', 'span': [35, 36], 'depth': 3})
+
+    def test_deep(self):
+        depth = 5000
+        tree = P.TeXDocument([])
+        node = tree
+        for _ in range(depth):
+            node.children.append(P.Enclosed(P.TokenType.LCBRACE, []))
+            node = node.children[0]
+
+        f = io.StringIO()
+        visit_tree.JSONLinesTreeExporter(f)(tree)
+        self.assertEqual(json.loads(f.getvalue().splitlines()[-1])['depth'], depth)
+
+        # ... but the parser is recursive, so that such a tree is damaged in recovery mode
+        text = '{' * depth + 'a' + '}' * depth
+        with self.assertRaises(RecursionError):
+            P.Parser(text).parse()
+
+        parser = P.Parser(text, spans=True, recover=True)
+        f = io.StringIO()
+        visit_tree.JSONLinesTreeExporter(f)(parser.parse())
+        self.assertEqual(json.loads(f.getvalue().splitlines()[-1])['type'], 'Damaged')
+        self.assertEqual(len(parser.errors), 1)
+
 
 class WordCountTestCase(unittest.TestCase):
 
@@ -198,3 +463,397 @@ class WordCountTestCase(unittest.TestCase):
 
     def test_unary(self):
         self.assertEqual(self.count('\\alpha_{xx}', macro_as_word=['alpha']), 1)
+
+    def test_unicode(self):
+        segmenter = UnicodeSegmenter()
+
+        def count(text):
+            return WordCounter([], [], [], segmenter=segmenter)(P.Parser(text).parse())
+
+        self.assertEqual(count('this is a test'), 4)
+        self.assertEqual(count('Fig.~\\ref{a} and Fig.~2'), 4)
+        self.assertEqual(self.count('Fig.~2'), 1)
+
+        self.assertEqual(count('\u6f22\u5b57\u3067\u3059\u3002'), 4)  # punctuation is not a word
+        self.assertEqual(count('in \u4e2d\u6587 text'), 4)
+        self.assertEqual(count('\u304b\u3099\u304d'), 2)  # combining mark stays with the kana
+        self.assertEqual(count('cafe\u0301 \u0301'), 1)  # a lone mark is not a word
+        self.assertEqual(count('a\u00a0b\u2009c'), 3)  # non-breaking and thin spaces
+
+        self.assertEqual(UnicodeSegmenter('~-').words('a~b-c d \u4e2d\u6587'), ['a', 'b', 'c', 'd', '\u4e2d', '\u6587'])
+
+    def test_memoize(self):
+        text = '\\begin{x}\\textbf{a b} & c\\end{x}' * 3
+        tree = P.Parser(text, intern=True).parse()
+        self.assertIs(tree.children[0], tree.children[2])
+
+        counter = WordCounter([], ['textbf'], [], memoize=True)
+        self.assertEqual(counter(tree), 9)
+        self.assertEqual(counter(tree), 9)
+        self.assertEqual(len(counter.memo), 7)
+
+
+class IndexTestCase(unittest.TestCase):
+
+    SOURCE = '\n'.join([
+        '\\begin{document}',
+        '\\begin{abstract}Some words \\cite{a}.  % comment',
+        '\\end{abstract}',
+        'Text\\cite[p. 2]{b,c}  and \\LaTeX  % comment',
+        '\\begin{figure}\\caption{one two}\\end{figure}',
+        '\\begin{figure}\\begin{figure}three\\end{figure}\\end{figure}',
+        '\\end{document}'
+    ])
+
+    def setUp(self):
+        self.index = NameIndex(self.SOURCE)
+        self.tree = P.Parser(self.SOURCE, index=self.index).parse()
+
+    def test_index(self):
+        self.assertNotIn('begin', self.index.macros)
+        self.assertNotIn('end', self.index.macros)
+
+        cites = self.index.select('cite')
+        self.assertEqual([self.index.text(e) for e in cites], ['\\cite{a}', '\\cite[p. 2]{b,c}'])
+        self.assertEqual([e.node.arguments[-1].children[0].text for e in cites], ['a', 'b,c'])
+
+        self.assertEqual(self.index.text(self.index.select('LaTeX')[0]), '\\LaTeX')
+        self.assertEqual(
+            self.index.text(self.index.select('abstract')[0]), self.SOURCE.splitlines()[1] + '\n\\end{abstract}')
+
+        figures = self.index.select('figure')
+        self.assertEqual(len(figures), 3)
+        self.assertEqual(self.index.text(figures[0]), self.SOURCE.splitlines()[4])
+        self.assertEqual(self.index.text(figures[2]), '\\begin{figure}three\\end{figure}')
+
+        document = self.index.select('document')[0]
+        self.assertIs(document.node, self.tree.children[0])
+        self.assertEqual((document.start, document.end), (0, len(self.SOURCE)))
+
+        self.assertEqual(len(self.index.select('figure', environments=False)), 0)
+        self.assertEqual(len(self.index.select('caption', 'cite')), 3)
+
+    def test_count_words(self):
+        counter = WordCounter(['abstract', 'figure'], [], [])
+
+        self.assertEqual(NameIndex.count_words(self.index.select('abstract'), counter), 3)
+        self.assertEqual(NameIndex.count_words(self.index.select('caption'), counter), 2)
+        self.assertEqual(NameIndex.count_words(self.index.select('figure'), counter), 0)
+        self.assertEqual(NameIndex.count_words(self.index.select('figure'), WordCounter([], [], [])), 1)
+        self.assertEqual(NameIndex.count_words(self.index.select('document'), counter), 2)
+
+    def test_recover(self):
+        source = '\\emph{a \\cite{x}\n\n\\cite{y} b'
+        index = NameIndex(source)
+        P.Parser(source, index=index, recover=True).parse()
+
+        # the first ``\\cite`` is in the damaged part, the second one is parsed again after it
+        cites = index.select('cite')
+        self.assertEqual([index.text(e) for e in cites], ['\\cite{y}'])
+        self.assertEqual(NameIndex.count_words(cites, WordCounter([], [], [])), 1)
+        self.assertEqual(len(index.select('emph')), 0)
+
+
+class DiffTestCase(unittest.TestCase):
+
+    OLD = '\n'.join([
+        '\\begin{document}',
+        '\\section{Introduction}',
+        'This is the first paragraph.',
+        '',
+        'This is a second paragraph, that will change.',
+        '\\section{Method}',
+        'We did things.',
+        '\\section{Old}',
+        'To be removed entirely.',
+        '\\end{document}'
+    ])
+
+    NEW = '\n'.join([
+        '\\begin{document}',
+        '\\section{Introduction}',
+        'This is the first paragraph.',
+        '',
+        'This is a second paragraph, which has changed \\textbf{a lot}.',
+        '\\section{Method}',
+        'We did things.',
+        '\\section{Results}',
+        'New results.',
+        '\\end{document}'
+    ])
+
+    def setUp(self):
+        self.lister = diff.WordLister([], ['section', 'textbf'], ['LaTeX'])
+
+    def test_lister(self):
+        counter = WordCounter(self.lister.exclude_env, self.lister.include_macro, self.lister.macro_as_words)
+        for text in [self.OLD, self.NEW, 'a \\LaTeX{} $x$ $$y$$ \\begin{x}[a]c & d\\end{x}\\alpha_{x}']:
+            tree = P.Parser(text).parse()
+            self.assertEqual(len(self.lister(tree)), counter(tree))
+
+    def test_split(self):
+        sections = diff.split(P.Parser(self.OLD).parse(), self.lister)
+
+        self.assertEqual([s.title for s in sections], ['', 'Introduction', 'Method', 'Old'])
+        self.assertEqual(sections[0].size(), 0)
+        self.assertEqual(sections[1].paragraphs, [
+            ['Introduction'], ['This', 'is', 'the', 'first', 'paragraph.'],
+            ['This', 'is', 'a', 'second', 'paragraph,', 'that', 'will', 'change.']])
+
+    def test_diff(self):
+        result = diff.diff(P.Parser(self.OLD).parse(), P.Parser(self.NEW).parse(), self.lister)
+
+        self.assertEqual(
+            [(s.title, s.added, s.removed) for s in result],
+            [('', 0, 0), ('Introduction', 6, 3), ('Method', 0, 0), ('Old', 0, 5), ('Results', 3, 0)])
+
+        result = diff.diff(P.Parser(self.OLD).parse(), P.Parser(self.OLD).parse(), self.lister)
+        self.assertTrue(all(s.added == 0 and s.removed == 0 for s in result))
+
+        # a section which is renamed is diffed with its previous version
+        body = ''.join('Paragraph {} of the section.\n\n'.format(i) for i in range(50))
+        old = '\\section{{Introdution}}\n{}\\section{{Method}}\nWe did things.'.format(body)
+        new = '\\section{{Introduction}}\n{}A new paragraph.\n\n\\section{{Methods}}\nWe did other things.'.format(body)
+        result = diff.diff(P.Parser(old).parse(), P.Parser(new).parse(), self.lister)
+
+        self.assertEqual(
+            [(s.title, s.added, s.removed) for s in result],
+            [('', 0, 0), ('Introduction', 4, 1), ('Method', 0, 4), ('Methods', 5, 0)])
+
+
+class CorpusTestCase(unittest.TestCase):
+
+    FILES = {
+        'main.tex': '\\documentclass{article}\n\\begin{document}\nHello world.\n\\input{sections/intro}\n'
+                    '% \\input{sections/none}\n\\end{document}\n',
+        'sections/intro.tex': 'Intro words here. \\include{sections/deep}\n',
+        'sections/deep.tex': 'Deep one.\n',
+        'sections/figure.tex': '\\documentclass{standalone}\nx',
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_find_main(self):
+        self.assertEqual(corpus.find_main(self.FILES), 'main.tex')
+
+        with self.assertRaises(corpus.CorpusError):
+            corpus.find_main({'a.tex': '% \\documentclass{article}'})
+
+    def test_resolve_includes(self):
+        source = corpus.resolve_includes('main.tex', self.FILES)
+        self.assertIn('Intro words here. Deep one.', source)
+        self.assertIn('% \\input{sections/none}', source)
+
+        files = {'a/main.tex': '\\input{b}\\input{c}', 'a/b.tex': 'x', 'a/c': 'y', 'b.tex': 'z'}
+        self.assertEqual(corpus.resolve_includes('a/main.tex', files), 'xy')
+
+        with self.assertRaises(corpus.CorpusError):
+            corpus.resolve_includes('main.tex', {'main.tex': '\\input{main}'})
+
+    def test_count_corpus(self):
+        with tarfile.open(self.path('a.tar.gz'), 'w:gz') as archive:
+            for name, content in self.FILES.items():
+                data = content.encode()
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+        with zipfile.ZipFile(self.path('b.zip'), 'w') as archive:
+            for name, content in self.FILES.items():
+                archive.writestr(name, content)
+
+        with gzip.open(self.path('c.gz'), 'wb') as f:
+            f.write(b'\\documentclass{article}\\begin{document}a b\\end{document}')
+
+        with open(self.path('d.tar'), 'w') as f:
+            f.write('not an archive')
+
+        archives = list(corpus.find_archives([self.directory.name]))
+        self.assertEqual([os.path.basename(path) for path in archives], ['a.tar.gz', 'b.zip', 'c.gz', 'd.tar'])
+
+        results = list(corpus.count_corpus(archives, [], [], [], processes=1))
+        self.assertEqual([r.get('words') for r in results], [7, 7, 2, None])
+        self.assertEqual(results[0]['main'], 'main.tex')
+        self.assertEqual(results[0]['files'], 4)
+        self.assertIn('error', results[3])
+
+        with gzip.open(self.path('e.gz'), 'wb') as f:
+            f.write(b'\\documentclass{article}\\begin{document}a } b\n\nc\\end{document}')
+
+        result = corpus.count_paper(self.path('e.gz'), [], [], [], recover=True)
+        self.assertEqual(result['words'], 2)
+        self.assertEqual(result['damaged'], [(41, 46)])
+
+        statistics = corpus.CorpusStatistics()
+        for result in results:
+            statistics.add(result)
+
+        self.assertEqual(statistics.as_dict()['errors'], 1)
+        self.assertEqual(statistics.as_dict()['words'], 16)
+
+
+class ApproxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.counter = WordCounter(['equation'], ['textbf'], [])
+
+        paragraphs = []
+        for i in range(3000):
+            paragraphs.append(' '.join(['word'] * (i % 50)) + ' \\textbf{a b} \\cite{x}')
+            if i % 7 == 0:
+                paragraphs.append('\\begin{equation}\n x = 1\n\n y = 2\n\\end{equation}')
+            if i % 11 == 0:
+                paragraphs.append('\\begin{itemize}\n\\item one two\n\n\\item three\n\\end{itemize}')
+
+        self.source = ('\\begin{document}\n' + '\n\n'.join(paragraphs) + '\n\\end{document}\n').encode()
+        self.words = self.counter(P.Parser(self.source.decode()).parse())
+
+    def test_read_paragraphs(self):
+        f = io.BytesIO(b'aa\n\nbbbb\n\ncc\n \ndd')
+
+        self.assertEqual(approx.read_paragraphs(f, 0, 1, 0, 17), (b'aa\n\n', 4))
+        self.assertEqual(approx.read_paragraphs(f, 1, 4, 0, 17)[0], b'bbbb\n\n')  # starts in the window
+        self.assertEqual(approx.read_paragraphs(f, 5, 2, 0, 17)[0], b'')  # none starts in the window
+        self.assertEqual(approx.read_paragraphs(f, 9, 7, 0, 17)[0], b'cc\n \ndd')
+
+    def test_balance(self):
+        self.assertEqual(approx.balance('a\\end{x} b \\begin{y}c'), '\\begin{x}a\\end{x} b \\begin{y}c\\end{y}')
+        self.assertEqual(
+            self.counter(P.Parser(approx.balance('x = 1 \\end{equation} a b')).parse()), 2)
+
+    def test_estimate(self):
+        result = approx.estimate(io.BytesIO(self.source), self.counter, budget=16384, chunk_size=1024, seed=0)
+        self.assertFalse(result.exact)
+        self.assertLess(result.sampled, 20000)
+        self.assertTrue(result.low <= self.words <= result.high)
+
+        result = approx.estimate(io.BytesIO(self.source), self.counter, budget=len(self.source))
+        self.assertTrue(result.exact)
+        self.assertEqual((result.words, result.low, result.high), (self.words, self.words, self.words))
+
+    def test_recover(self):
+        with self.assertRaises(P.ParserSyntaxError):
+            approx.estimate(io.BytesIO(b'a } b'), self.counter)
+
+        result = approx.estimate(io.BytesIO(b'a } b\n\nc d'), self.counter, recover=True)
+        self.assertEqual((result.words, result.damaged), (3, 1))
+
+        # sampled: the damaged parts are not counted, but the estimate stays the same
+        source = self.source.replace(b'\\cite{x}', b'\\cite{x', 20)
+        result = approx.estimate(io.BytesIO(source), self.counter, budget=16384, chunk_size=1024, seed=0, recover=True)
+        self.assertFalse(result.exact)
+        self.assertTrue(result.low <= self.words <= result.high)
+
+
+class AsyncCountTestCase(unittest.TestCase):
+
+    def test_count_text(self):
+        text = 'a \\textbf{b} c'
+        self.assertEqual(asyncio.run(aio.count_text(text)), 2)
+        self.assertEqual(asyncio.run(aio.count_text(text, include_macro=['textbf'])), 3)
+
+    def test_cache(self):
+        counter = aio.AsyncWordCounter()
+
+        async def run():
+            return await asyncio.gather(*(counter.count_text('this is a test') for _ in range(10)))
+
+        self.assertEqual(asyncio.run(run()), [4] * 10)
+        self.assertEqual(len(counter.cache), 1)
+
+        # the configuration is part of the key
+        other = aio.AsyncWordCounter(macro_as_words=['x'], cache=counter.cache)
+        self.assertEqual(asyncio.run(other.count_text('this is a test')), 4)
+        self.assertEqual(len(counter.cache), 2)
+
+    def test_cancel(self):
+        counter = aio.AsyncWordCounter(max_concurrency=1)
+
+        async def run():
+            first = asyncio.ensure_future(counter.count_text('a b'))
+            second = asyncio.ensure_future(counter.count_text('a b c'))
+            await asyncio.sleep(0)
+            second.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await second
+
+            return await first
+
+        self.assertEqual(asyncio.run(run()), 2)
+        self.assertEqual(len(counter.cache), 1)
+        self.assertEqual(len(counter._pending), 0)
+
+        # a new request does not join a count which is being cancelled
+        text = 'a b ' * 20000
+
+        async def run_again():
+            first = asyncio.ensure_future(counter.count_text(text))
+            while len(counter._pending) == 0 or not counter._semaphore.locked():  # the count is running
+                await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)  # the count is cancelled, but its task did not end yet
+
+            second = await counter.count_text(text)
+
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+
+            return second
+
+        self.assertEqual(asyncio.run(run_again()), 40000)
+        self.assertEqual(len(counter._pending), 0)
+
+    def test_threads(self):
+        lock = threading.Lock()
+        running = []
+        most = []
+        count = aio.count
+
+        def slow_count(*args):
+            with lock:
+                running.append(None)
+                most.append(len(running))
+
+            time.sleep(.01)
+            with lock:
+                running.pop()
+
+            return count(*args)
+
+        async def run(counter):
+            return await asyncio.gather(*(counter.count_text('a ' * i) for i in range(8)))
+
+        # in threads, counts run one at a time, since they would only compete for the GIL
+        with unittest.mock.patch.object(aio, 'count', slow_count):
+            counter = aio.AsyncWordCounter(max_concurrency=4)
+            self.assertTrue(counter.threads)
+            self.assertEqual(asyncio.run(run(counter)), list(range(8)))
+            self.assertEqual(max(most), 1)
+
+        with concurrent.futures.ProcessPoolExecutor(1) as executor:
+            self.assertFalse(aio.AsyncWordCounter(executor=executor).threads)
+
+    def test_count_files(self):
+        texts = ['a b', 'a b c', '\\begin{x}a\\end{x}', 'a $b$ c d']
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i, text in enumerate(texts):
+                path = os.path.join(directory, '{}.tex'.format(i))
+                with open(path, 'w') as f:
+                    f.write(text)
+                paths.append(path)
+
+            counter = aio.AsyncWordCounter(max_concurrency=2)
+            self.assertEqual(asyncio.run(counter.count_files(paths)), [2, 3, 1, 4])
+
+            with self.assertRaises(FileNotFoundError):
+                asyncio.run(counter.count_files(paths + [os.path.join(directory, 'none.tex')]))
@@ -1,3 +1,7 @@
+import json
+import sys
+from typing import Iterator, List, TextIO, Tuple
+
 from pytexcount import parser
 
 
@@ -15,67 +19,196 @@ class NodeVisitor(object):
         raise Exception('No visit_{} method'.format(type(node).__name__.lower()))
 
 
-class PrintTreeStructure(NodeVisitor):
+class TreeExporter(NodeVisitor):
+    """Write a tree to a file object.
+
+    The tree is walked iteratively (so that deep trees are not a problem), and the output goes through a buffer which
+    is written to ``f`` each time it reaches ``buffer_size`` characters, so that the whole output is never in memory.
+    Subclasses implement :meth:`export` (which writes ``node`` and its children), along with the ``visit_[type]``
+    methods they need.
+    """
+
+    def __init__(self, f: TextIO, buffer_size: int = 65536):
+        self.f = f
+        self.buffer_size = buffer_size
+        self.buffer: List[str] = []
+        self.buffered = 0
+
     def __call__(self, node: parser.ParserNode):
-        self.visit(node, depth=0)
+        self.export(node)
+        self.flush()
+
+    def write(self, s: str):
+        self.buffer.append(s)
+        self.buffered += len(s)
+
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.f.write(''.join(self.buffer))
+        self.buffer.clear()
+        self.buffered = 0
 
     @staticmethod
-    def indent(depth: int, spacer: str = '|  '):
-        print(spacer * depth, end='')
-
-    def visit_texdocument(self, node: parser.TeXDocument, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ TexDocument::')
-
-        for child in node.children:
-            self.visit(child, depth + 1)
-
-    def visit_text(self, node: parser.Text, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ Text: `{}`'.format(node.text))
-
-    def visit_macro(self, node: parser.Macro, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ Macro ({})::'.format(node.name))
-        for argument in node.arguments:
-            self.visit(argument, depth + 1)
-
-    def visit_argument(self, node: parser.Argument, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ Argument ({})::'.format('optional' if node.optional else 'mandatory'))
-        for child in node.children:
-            self.visit(child, depth + 1)
-
-    def visit_environment(self, node: parser.Environment, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ Environment ({})::'.format(node.name))
-        for argument in node.arguments:
-            self.visit(argument, depth + 1)
-        for child in node.children:
-            self.visit(child, depth + 1)
-
-    def visit_escapingsequence(self, node: parser.EscapingSequence, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ Escaping sequence ({})::'.format(node.to_escape))
-
-    def visit_mathdollarenv(self, node: parser.MathDollarEnv, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ MathEnvironment ({})::'.format('$$' if node.double else '$'))
-        for child in node.children:
-            self.visit(child, depth + 1)
-
-    def visit_enclosed(self, node: parser.Enclosed, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ Enclosing ({})::'.format(node.opening))
-        for child in node.children:
-            self.visit(child, depth + 1)
-
-    def visit_unaryoperator(self, node: parser.UnaryOperator, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ Unary operator ({})::'.format(node.operator))
-        for child in node.children:
-            self.visit(child, depth + 1)
-
-    def visit_separator(self, node, depth):
-        PrintTreeStructure.indent(depth)
-        print('+ Separator')
+    def children(node: parser.ParserNode) -> List[parser.ParserNode]:
+        if type(node) is parser.Macro:
+            return node.arguments
+        elif type(node) is parser.Environment:
+            return node.arguments + node.children
+        elif isinstance(node, parser.NodeWithChildren):
+            return node.children
+        else:
+            return []
+
+    @staticmethod
+    def walk(node: parser.ParserNode) -> Iterator[Tuple[bool, parser.ParserNode, int]]:
+        """Yield ``(True, node, depth)`` when entering a node, and ``(False, node, depth)`` when leaving it
+        """
+
+        stack = [(True, node, 0)]
+
+        while stack:
+            entering, node, depth = stack.pop()
+            yield entering, node, depth
+
+            if entering:
+                stack.append((False, node, depth))
+                stack.extend((True, child, depth + 1) for child in reversed(TreeExporter.children(node)))
+
+    def export(self, node: parser.ParserNode):
+        raise Exception('No export method in {}'.format(type(self).__name__))
+
+
+class TextTreeExporter(TreeExporter):
+    """Indented text, one line per node"""
+
+    def __init__(self, f: TextIO, buffer_size: int = 65536, spacer: str = '|  '):
+        super().__init__(f, buffer_size)
+        self.spacer = spacer
+
+    def export(self, node: parser.ParserNode):
+        for entering, node, depth in self.walk(node):
+            if entering:
+                self.write('{}{}\n'.format(self.spacer * depth, self.visit(node)))
+
+    def visit_texdocument(self, node: parser.TeXDocument):
+        return '+ TexDocument::'
+
+    def visit_text(self, node: parser.Text):
+        return '+ Text: `{}`'.format(node.text)
+
+    def visit_macro(self, node: parser.Macro):
+        return '+ Macro ({})::'.format(node.name)
+
+    def visit_argument(self, node: parser.Argument):
+        return '+ Argument ({})::'.format('optional' if node.optional else 'mandatory')
+
+    def visit_environment(self, node: parser.Environment):
+        return '+ Environment ({})::'.format(node.name)
+
+    def visit_escapingsequence(self, node: parser.EscapingSequence):
+        return '+ Escaping sequence ({})::'.format(node.to_escape)
+
+    def visit_mathdollarenv(self, node: parser.MathDollarEnv):
+        return '+ MathEnvironment ({})::'.format('$$' if node.double else '$')
+
+    def visit_enclosed(self, node: parser.Enclosed):
+        return '+ Enclosing ({})::'.format(node.opening)
+
+    def visit_unaryoperator(self, node: parser.UnaryOperator):
+        return '+ Unary operator ({})::'.format(node.operator)
+
+    def visit_separator(self, node):
+        return '+ Separator'
+
+    def visit_damaged(self, node: parser.Damaged):
+        return '+ Damaged ({}): `{}`'.format(node.error, node.text)
+
+
+class JSONLinesTreeExporter(TreeExporter):
+    """One JSON object per node (in document order), with its type, depth, attributes and span (if recorded)"""
+
+    def export(self, node: parser.ParserNode):
+        for entering, node, depth in self.walk(node):
+            if entering:
+                description = self.visit(node)
+                description['depth'] = depth
+                self.write(json.dumps(description) + '\n')
+
+    @staticmethod
+    def describe(node: parser.ParserNode, **kwargs) -> dict:
+        description = {'type': type(node).__name__}
+        description.update(kwargs)
+        if node.span is not None:
+            description['span'] = node.span
+
+        return description
+
+    def visit_texdocument(self, node: parser.TeXDocument):
+        return self.describe(node)
+
+    def visit_text(self, node: parser.Text):
+        return self.describe(node, text=node.text)
+
+    def visit_macro(self, node: parser.Macro):
+        return self.describe(node, name=node.name)
+
+    def visit_argument(self, node: parser.Argument):
+        return self.describe(node, optional=node.optional)
+
+    def visit_environment(self, node: parser.Environment):
+        return self.describe(node, name=node.name)
+
+    def visit_escapingsequence(self, node: parser.EscapingSequence):
+        return self.describe(node, to_escape=node.to_escape)
+
+    def visit_mathdollarenv(self, node: parser.MathDollarEnv):
+        return self.describe(node, double=node.double)
+
+    def visit_enclosed(self, node: parser.Enclosed):
+        return self.describe(node, opening=node.opening.value)
+
+    def visit_unaryoperator(self, node: parser.UnaryOperator):
+        return self.describe(node, operator=node.operator.value)
+
+    def visit_separator(self, node):
+        return self.describe(node)
+
+    def visit_damaged(self, node: parser.Damaged):
+        return self.describe(node, text=node.text, error=node.error, position=node.position)
+
+
+class JSONTreeExporter(JSONLinesTreeExporter):
+    """A single JSON object, in which each node has its children in a ``children`` list (if it has any)"""
+
+    def export(self, node: parser.ParserNode):
+        first = [True]  # for each level, whether the next node is the first child
+
+        for entering, node, depth in self.walk(node):
+            has_children = len(self.children(node)) > 0
+
+            if entering:
+                if not first[-1]:
+                    self.write(',')
+                first[-1] = False
+
+                self.write(json.dumps(self.visit(node))[:-1])
+                if has_children:
+                    self.write(', "children": [')
+                    first.append(True)
+            else:
+                if has_children:
+                    self.write(']')
+                    first.pop()
+
+                self.write('}')
+
+        self.write('\n')
+
+
+class PrintTreeStructure(TextTreeExporter):
+    """Print the tree in the standard output"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)